@@ -22,6 +22,8 @@ import random
 import string
 import redis
 import argparse
+import signal
+import sys
 
 __author__ = "Dennis Zyska, Nils Dycke"
 __credits__ = ["Dennis Zyska", "Nils Dycke"]
@@ -86,7 +88,11 @@ def init():
 
         :return: the sid of the connection
         """
-        db.clients.connect(sid=request.sid, ip=request.remote_addr, data=data)
+        if not db.clients.admit(request.remote_addr):
+            return False
+        if not db.clients.connect(sid=request.sid, ip=request.remote_addr, data=data):
+            logger.debug(f"Rejected socket connection with sid: {request.sid} (too many waiting connections)")
+            return False
         session["sid"] = request.sid
 
         logger.debug(f"New socket connection established with sid: {request.sid} and ip: {request.remote_addr}")
@@ -109,6 +115,16 @@ def init():
         "host": "0.0.0.0",
         "port": os.getenv("BROKER_PORT", 4852)
     }
+    def shutdown(signum, frame):
+        """
+        Stop the broker on SIGTERM (e.g., docker stop) and SIGINT, buffered writes are flushed on exit (atexit)
+        """
+        logger.info("Received signal {}, shutting down ...".format(signum))
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
     logger.info("App starting ...", app_config)
     socketio.run(app, **app_config, log_output=True)
 
@@ -59,6 +59,15 @@ class Skills(CLI):
             skill_parser.add_argument('--network', help='Network name (Default: network_broker)', type=str,
                                       default='network_broker')
             skill_parser.add_argument('--skill', help='Name of the skill', default='')
+            skill_parser.add_argument('--slots', help='Number of concurrent tasks per container '
+                                                      '(default: batch size)', type=int, default=None)
+            skill_parser.add_argument('--batch_size', help='Maximum number of tasks executed as batch (default: 1)',
+                                      type=int, default=None)
+            skill_parser.add_argument('--batch_wait', help='Maximum time in seconds waiting for a full batch '
+                                                           '(default: 0.05)', type=float, default=None)
+            skill_parser.add_argument('--serializer', help='Encoding of payloads, msgpack is used if the broker '
+                                                           'allows it (default: json)', choices=['json', 'msgpack'],
+                                      default=None)
             self.skills[skill].set_parser(skill_parser)
 
         self.parser_stop = model_parser.add_parser('stop', help="Stop a skill")
@@ -17,12 +17,22 @@ class Client:
     @author: Dennis Zyska
     """
 
-    def __init__(self, url, queue_size=200, buffer_size=300, name="Simple Client", logger=None):
+    def __init__(self, url, queue_size=200, buffer_size=300, name="Simple Client", logger=None, compression=None,
+                 serializer="json"):
+        """
+        Create a new client
+        :param compression: list of compression codecs offered to the broker, e.g. ["zstd", "zlib"]
+        :param serializer: encoding of payloads (json or msgpack), msgpack is used if the broker allows it
+        """
         self.url = url
+        self.compression = compression
+        self.serializer = serializer
         self.logger = logger
         self.in_queue = mp.Manager().Queue(queue_size)
         self.out_queue = mp.Manager().Queue(queue_size)
         self.skills = []
+        self.configs = {}  # config hash -> skill config
+        self.hashes = {}  # skill name -> hash of the last config
         self.client = None
         self.role = "guest"
         self.results_buffer = deque(maxlen=buffer_size)
@@ -36,7 +46,8 @@ class Client:
         if self.logger is not None:
             self.logger.info("Start auth client ...")
         ctx = mp.get_context('spawn')
-        self.client = ctx.Process(target=client_process, args=(self.name, self.url, self.in_queue, self.out_queue))
+        self.client = ctx.Process(target=client_process, args=(self.name, self.url, self.in_queue, self.out_queue,
+                                                               self.compression, self.serializer))
         self.client.start()
 
         return self.wait_for_event("connected", timeout=30)
@@ -44,8 +55,14 @@ class Client:
     def connect(self):
         self.start()
 
-    def auth(self, private_key_path="./private_key.pem"):
-        keys = Keys(private_key_path=private_key_path)
+    def auth(self, private_key_path="./private_key.pem", key_type="rsa"):
+        """
+        Authenticate at the broker
+        :param private_key_path: path to the private key, a new key is used if None
+        :param key_type: type of a new key (rsa or ed25519)
+        :return: authInfo message or False
+        """
+        keys = Keys(private_key_path=private_key_path, key_type=key_type)
 
         # send auth request
         self.put({"event": "authRequest", "data": {}})
@@ -108,6 +125,22 @@ class Client:
         except queue.Empty:
             return False
 
+    def get_config(self, skill, timeout=10):
+        """
+        Get the config of a skill (cached per config hash, the broker only sends changed configs)
+        :param skill: name of the skill
+        :param timeout: timeout in seconds
+        :return: config or None
+        """
+        self.put({"event": "skillGetConfig", "data": {"name": skill, "hash": self.hashes.get(skill)}})
+        m = self.wait_for_event("skillConfig", timeout=timeout)
+        if not m or m.get('hash') is None:
+            return m['data'] if m else None
+        if m['hash']['modified']:
+            self.configs[m['hash']['hash']] = m['data']
+        self.hashes[skill] = m['hash']['hash']
+        return self.configs.get(m['hash']['hash'])
+
     def check_skill(self, skill):
         """
         Check if skill is available
@@ -2,25 +2,93 @@ import logging
 import multiprocessing as mp
 import time
 
+import msgpack
 import socketio
 
 from broker import init_logging
+from broker.utils.Compression import Compression
 
 
-def client_process(name, url, in_queue: mp.Queue, out_queue: mp.Queue):
+def decode(data):
+    """
+    Decode (msgpack) and decompress the payloads of a received message
+    :param data: message data
+    :return: message data with decoded payloads
+    """
+    if isinstance(data, dict):
+        if 'data' in data:
+            payload = msgpack.unpackb(data['data'], raw=False) if isinstance(data['data'], bytes) else data['data']
+            data = {**data, 'data': Compression.decompress(payload)}
+        if 'results' in data and isinstance(data['results'], list):
+            data = {**data, 'results': [decode(r) for r in data['results']]}
+    return data
+
+
+def encode(message, compression, use_msgpack=False):
+    """
+    Compress and encode (msgpack) the payloads of a message to send
+    :param message: message with event and data
+    :param compression: negotiated Compression or None
+    :param use_msgpack: msgpack encoding of payloads was negotiated
+    :return: message data
+    """
+    data = message['data']
+    if (compression is None and not use_msgpack) or not isinstance(data, dict):
+        return data
+
+    def payload(d):
+        if compression is not None:
+            d = compression.compress(d)
+        return msgpack.packb(d, use_bin_type=True) if use_msgpack else d
+
+    if message['event'] == "skillRequest" and 'data' in data:
+        return {**data, 'data': payload(data['data'])}
+    if message['event'] == "skillRequestBatch" and isinstance(data.get('requests'), list):
+        return {**data, 'requests': [{**r, 'data': payload(r['data'])} if 'data' in r else r
+                                     for r in data['requests']]}
+    return data
+
+
+def client_process(name, url, in_queue: mp.Queue, out_queue: mp.Queue, compression=None, serializer="json"):
     logger = init_logging(name, level=logging.getLevelName("INFO"))
     sio = socketio.Client(logger=logger, engineio_logger=logger)
+    negotiated = {"compression": None, "msgpack": False}
+    catalog = {"version": 0}
 
     @sio.on('*')
     def catch_all(event, data):
-        out_queue.put({"event": event, "data": data})
+        out_queue.put({"event": event, "data": decode(data)})
+
+    @sio.on('skillUpdate')
+    def skill_update(data, version=None):
+        out_queue.put({"event": "skillUpdate", "data": data, "version": version})
+        if version is not None:
+            if not version.get('full', False) and version['previous'] > catalog['version']:
+                # missed an update, request the full list of skills
+                sio.emit('skillGetAll')
+            catalog['version'] = max(catalog['version'], version['version'])
+
+    @sio.on('skillConfig')
+    def skill_config(data, config_hash=None):
+        out_queue.put({"event": "skillConfig", "data": data, "hash": config_hash})
 
     sio.on('connect', lambda: [out_queue.put({"event": "connected", "data": {}})])
 
+    @sio.on('compression')
+    def compression_negotiated(data):
+        negotiated["compression"] = Compression(data['codec'], data['threshold'])
+        out_queue.put({"event": "compression", "data": data})
+
+    @sio.on('serializer')
+    def serializer_negotiated(data):
+        negotiated["msgpack"] = data['serializer'] == "msgpack"
+        out_queue.put({"event": "serializer", "data": data})
+
     # always send task requests back to broker
 
     @sio.on('taskRequest')
     def task_request(data):
+        data = decode(data)
         out_queue.put({"event": "taskRequest", "data": data})
         if isinstance(data['data'], dict) and 'sleep' in data['data']:
             time.sleep(data['data']['sleep'])
@@ -31,10 +99,15 @@ def client_process(name, url, in_queue: mp.Queue, out_queue: mp.Queue):
             if sio.connected:
                 logger.debug("Waiting for next message...")
                 message = in_queue.get()
-                sio.emit(message['event'], message['data'])
+                sio.emit(message['event'], encode(message, negotiated["compression"], negotiated["msgpack"]))
                 logger.debug("Send message: {}".format(message))
             else:
-                sio.connect(url)
+                auth = {}
+                if compression:
+                    auth['compression'] = compression
+                if serializer == "msgpack":
+                    auth['serializer'] = serializer
+                sio.connect(url, auth=auth if auth else None)
         except socketio.exceptions.ConnectionError:
             logger.error("Connection to broker failed. Trying again in 5 seconds ...")
             time.sleep(5)
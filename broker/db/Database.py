@@ -1,12 +1,16 @@
 import os
+import threading
+import time
 
 from arango import ArangoClient
 
+from broker import init_logging
 from broker.db.collection.Clients import Clients
 from broker.db.collection.Roles import Roles
 from broker.db.collection.Skills import Skills
 from broker.db.collection.Tasks import Tasks
 from broker.db.collection.Users import Users
+from broker.db.utils.HTTPClient import HTTPClient
 
 
 class Database:
@@ -18,31 +22,55 @@ class Database:
         if url:
             self.url = url
         else:
-            url = "http://{}:{}".format(os.getenv("ARANGODB_HOST", "localhost"), os.getenv("ARANGODB_PORT", "8529"))
+            self.url = "http://{}:{}".format(os.getenv("ARANGODB_HOST", "localhost"),
+                                             os.getenv("ARANGODB_PORT", "8529"))
         self._username = username
         self._password = password if password else os.getenv("ARANGODB_ROOT_PASSWORD", "root")
         self.db_name = db_name
+        self.logger = init_logging("db")
+
+        # sync: direct calls (non-blocking with eventlet), async: arangodb async job api (polling)
+        self.db_config = config['db'] if config is not None and 'db' in config else {}
+        self.mode = self.db_config.get('mode', 'sync')
+        self.http_client = HTTPClient(pool_size=self.db_config.get('poolSize', 10),
+                                      timing=self.db_config.get('timing', False))
 
         self.async_db, self.sync_db, self.sys_db = self._connect()
         self.async_db.clear_async_jobs()
-        self.db = self.async_db  # make async_db the default db
+        self.db = self.sync_db if self.mode == "sync" else self.async_db
 
         # initialize collections
-        self.clients = Clients(db=self, adb=self.async_db, config=config, socketio=socketio)
-        self.tasks = Tasks(db=self, adb=self.async_db, config=config, socketio=socketio)
-        self.skills = Skills(db=self, adb=self.async_db, config=config, socketio=socketio)
-        self.users = Users(db=self, adb=self.async_db, config=config, socketio=socketio)
-        self.roles = Roles(db=self, adb=self.async_db, config=config, socketio=socketio)
+        self.clients = Clients(db=self, adb=self.db, config=config, socketio=socketio)
+        self.tasks = Tasks(db=self, adb=self.db, config=config, socketio=socketio)
+        self.skills = Skills(db=self, adb=self.db, config=config, socketio=socketio)
+        self.users = Users(db=self, adb=self.db, config=config, socketio=socketio)
+        self.roles = Roles(db=self, adb=self.db, config=config, socketio=socketio)
+
+        if self.http_client.timing:
+            timing_thread = threading.Thread(target=self.log_timing)
+            timing_thread.daemon = True
+            timing_thread.start()
 
     def _connect(self):
         """
         Connects to arangodb
         :return: db instance
         """
-        db_client = ArangoClient(hosts=self.url)
+        db_client = ArangoClient(hosts=self.url, http_client=self.http_client)
         sys_db = db_client.db('_system', username=self._username, password=self._password)
         if not sys_db.has_database(self.db_name):
             sys_db.create_database(self.db_name)
         sync_db = db_client.db(self.db_name, username='root', password=self._password)
         async_db = sync_db.begin_async_execution(return_result=True)
         return async_db, sync_db, sys_db
+
+    def log_timing(self):
+        """
+        Regularly log the timing of the database calls
+        """
+        while True:
+            time.sleep(self.db_config.get('timingInterval', 60))
+            for endpoint, stats in sorted(self.http_client.get_stats(reset=True).items()):
+                self.logger.info("DB {} ({} mode): {} calls, mean {:.2f}ms, max {:.2f}ms, wait {:.2f}ms".format(
+                    endpoint, self.mode, stats['calls'], stats['mean'] * 1000, stats['max'] * 1000,
+                    stats['wait'] * 1000 / stats['calls']))
@@ -1,10 +1,21 @@
+import os
+import threading
+import time
 from datetime import datetime
 
+import msgpack
+import redis
 from flask_socketio import join_room
 
 from broker.db.utils import results
 from broker.db.collection import Collection
+from broker.db.utils.WriteBehind import WriteBehind
+from broker.utils.Admission import Admission
+from broker.utils.Compression import Compression
 from broker.utils.JobQuota import JobQuota
+from broker.utils.RateLimiter import RateLimiter
+from broker.utils.RedisJobQuota import RedisJobQuota
+from broker.utils.RedisQuota import RedisQuota
 from broker.utils.Quota import Quota
 
 
@@ -16,11 +27,92 @@ class Clients(Collection):
     """
 
     def __init__(self, db, adb, config, socketio):
+        # quotas are kept in memory (per process) or in redis (shared by all broker processes)
+        self.redis = None
+        store = config['quotaStore'] if 'quotaStore' in config else {"backend": "memory"}
+        if store['backend'] == "redis":
+            self.redis = redis.from_url("redis://{}:{}".format(os.getenv("REDIS_HOST", "localhost"),
+                                                               os.getenv("REDIS_PORT", "6379")))
+
         super().__init__("clients", db, adb, config, socketio)
         self.quotas = {}
+        self.compression = {}  # sid -> negotiated compression
+        self.msgpack = set()  # sids with msgpack encoded payloads
+
+        # admission of new connections (reconnect storms), clients are inserted in batches during a storm
+        self.admission = None
+        self.write_behind = None
+        if 'admission' in self.config and self.config['admission']['enabled']:
+            admission = self.config['admission']
+            self.admission = Admission(rate=admission['rate'], burst=admission['burst'],
+                                       max_queue=admission['maxQueue'], window=admission['window'])
+            self.write_behind = WriteBehind(self.collection, batch_size=admission['batchSize'],
+                                            interval=admission['interval'])
+
+        # rate limits of connections per ip address and of events per connection (before any database access)
+        self.limits = None
+        if 'limits' in self.config and self.config['limits']['enabled']:
+            limits = self.config['limits']
+            self.limits = {
+                "connections": RateLimiter(rate=limits['connections']['rate'], burst=limits['connections']['burst']),
+                "events": RateLimiter(rate=limits['events']['rate'], burst=limits['events']['burst']),
+            }
+            if limits.get('logInterval', 0) > 0:
+                log_thread = threading.Thread(target=self.log_stats)
+                log_thread.daemon = True
+                log_thread.start()
+
         self.index = results(self.collection.add_hash_index(fields=['sid'], name='sid_index', unique=False))
         self.index = results(self.collection.add_hash_index(fields=['connected'], name='connected_index', unique=False))
 
+    def admit(self, ip):
+        """
+        Check the connection rate limit of an ip address
+        :param ip: ip address
+        :return: True if the client can connect
+        """
+        if self.limits is None or ip in self.config['limits']['exempt']:
+            return True
+        return self.limits['connections'](ip)
+
+    def allow(self, sid, ip):
+        """
+        Check the event rate limit of a connection (skill nodes are not limited)
+
+        Events are limited per connection, so clients behind one NAT or proxy do not share a bucket.
+        :param sid: session id
+        :param ip: ip address
+        :return: True if the event can be handled
+        """
+        if self.limits is None or ip in self.config['limits']['exempt'] or sid in self.db.skills.routing.nodes:
+            return True
+        return self.limits['events'](sid)
+
+    def get_stats(self):
+        """
+        Statistics of the rate limits and the admission of new connections
+        :return: dict
+        """
+        stats = {}
+        if self.limits is not None:
+            stats.update({name: limit.get_stats() for name, limit in self.limits.items()})
+        if self.admission is not None:
+            stats['admission'] = self.admission.get_stats()
+        return stats
+
+    def log_stats(self):
+        """
+        Log the shed load in regular intervals (thread)
+        """
+        shed = 0
+        while True:
+            time.sleep(self.config['limits']['logInterval'])
+            stats = self.get_stats()
+            total = sum(stats[name]['shed'] for name in self.limits)
+            if total > shed:
+                self.logger.warning("Rate limits: {}".format(stats))
+            shed = total
+
     def connect(self, sid, ip, data, default_role="guest"):
         """
         Connect a client
@@ -28,57 +120,138 @@ class Clients(Collection):
         :param ip: ip address
         :param data: payload
         :param default_role: basic role
-        :return:
+        :return: client document or False if the connection is rejected
         """
+        if self.admission is not None and not self.admission.acquire():
+            return False
+
         role = self.db.roles.get(default_role)
-        user = results(self.collection.insert(
-            {
-                "sid": sid,
-                "ip": ip,
-                "data": data,
-                "role": role['name'],
-                "connected": True,
-                "first_contact": datetime.now().isoformat(),
-                "last_contact": datetime.now().isoformat(),
-            }
-        ))
+        user = {
+            "sid": sid,
+            "ip": ip,
+            "data": data,
+            "role": role['name'],
+            "connected": True,
+            "first_contact": datetime.now().isoformat(),
+            "last_contact": datetime.now().isoformat(),
+        }
+        if self.admission is not None and self.admission.storm():
+            user['_key'] = sid
+            self.write_behind.put(user)
+        else:
+            user = results(self.collection.insert(user))
         join_room(sid)
         join_room(role['room'])
 
         # add quota for sid
         self._apply_quota(sid, role['name'])
 
+        # negotiate compression of large payloads
+        self._negotiate(sid, data)
+
         # send skills
         self.db.skills.send_all(role['name'], to=sid)
 
         return user
 
+    def encode(self, sid, data):
+        """
+        Prepare data for a client (compressed with the negotiated codec)
+        :param sid: session id of the receiving client
+        :param data: payload
+        :return: payload for the client
+        """
+        data = Compression.encode(data, self.compression.get(sid), self.config.get('compression', {}).get('maxSize'))
+        if sid in self.msgpack:
+            return msgpack.packb(data, use_bin_type=True)
+        return data
+
+    def decode(self, sid, data):
+        """
+        Decode a payload of a client (msgpack encoded payloads are only accepted from negotiated connections)
+        :param sid: session id of the sending client
+        :param data: payload
+        :return: payload
+        """
+        if isinstance(data, bytes) and sid in self.msgpack:
+            return msgpack.unpackb(data, raw=False)
+        return data
+
+    def accepts(self, sid, data):
+        """
+        Check if a client is allowed to send a payload (compressed payloads only with the negotiated codec
+        and up to the maximum size)
+        :param sid: session id of the sending client
+        :param data: payload
+        :return: True if the payload is accepted
+        """
+        if not isinstance(data, bytes) and not Compression.is_compressed(data):
+            return True
+        compression = self.compression.get(sid)
+        if isinstance(data, bytes) or compression is None or data['compression'] != compression.codec:
+            return False
+        return Compression.valid_size(data['size'], self.config['compression'].get('maxSize'))
+
+    def _negotiate(self, sid, data):
+        """
+        Select the compression and the payload encoding of a connection from the connect payload
+        :param sid: session id
+        :param data: connect payload, e.g. {compression: ["zstd", "zlib"], serializer: "msgpack"}
+        """
+        if isinstance(data, dict) and data.get('serializer') == "msgpack" \
+                and 'socketio' in self.config and self.config['socketio'].get('msgpack', False):
+            self.msgpack.add(sid)
+            self.socketio.emit("serializer", {"serializer": "msgpack"}, to=sid)
+
+        if 'compression' not in self.config or not self.config['compression']['enabled'] or not isinstance(data, dict):
+            return
+        codec = Compression.negotiate(data.get('compression'), self.config['compression']['codecs'])
+        if codec is not None:
+            self.compression[sid] = Compression(codec, self.config['compression']['threshold'])
+            self.socketio.emit("compression", {"codec": codec, "threshold": self.config['compression']['threshold']},
+                               to=sid)
+
     def disconnect(self, sid):
+        pending = self._pending(sid)
+        if pending is not None:
+            self.write_behind.put({**pending, 'last_contact': datetime.now().isoformat(), 'connected': False})
         self.collection.update_match({"sid": sid, "connected": True},
                              {'last_contact': datetime.now().isoformat(), 'connected': False})
 
-        # remove sid from quota
-        del self.quotas[sid]
-
-        # close room
-        self.socketio.close_room(sid)
+        # remove skills by sid if exists (before cancel jobs, so tasks are not restarted on the same node)
+        self.db.skills.unregister(sid=sid)
 
         # cancel jobs
         self.db.tasks.terminate_by_disconnect(sid=sid)
+        self.db.tasks.queue.remove(sid)
+        self.db.tasks.drop_batches(sid)
 
-        # remove skills by sid if exists
-        self.db.skills.unregister(sid=sid)
+        # remove sid from quota
+        del self.quotas[sid]
+        self.compression.pop(sid, None)
+        if self.limits is not None:
+            self.limits['events'].discard(sid)
+        self.msgpack.discard(sid)
 
+        # close room
+        self.socketio.close_room(sid)
 
-    def _apply_quota(self, sid, role):
+    def _apply_quota(self, sid, role, owner=None):
         """
         Set quota for client
         :param sid: session id
         :param role: name of the role
+        :param owner: key of the user (quota in redis is shared by all connections of a user), default sid
         :return:
         """
+        # running jobs are kept if the role changes
+        jobs = None
         if sid in self.quotas:
-            del self.quotas[sid]
+            old = self.quotas.pop(sid)
+            jobs = old["jobs"].jobs
+            if old["owner"] is None:
+                # only the quota of the connection is reset, the quota of a user is shared by its connections
+                old["jobs"].reset()
 
         # set quota interval if set
         quotaInterval = 1
@@ -86,19 +259,49 @@ class Clients(Collection):
             quotaInterval = self.config['quotaInterval']
 
         role = self.db.roles(role)
+        if self.redis is not None:
+            store = self.config['quotaStore']
+            key = "{}{}:".format(store['prefix'], owner if owner is not None else sid)
+            self.quotas[sid] = {
+                "role": role,
+                "owner": owner,
+                "requests": RedisQuota(self.redis, key + "requests", max_len=role['quota']['requests'],
+                                       interval=quotaInterval),
+                "results": RedisQuota(self.redis, key + "results", max_len=role['quota']['results'],
+                                      interval=quotaInterval),
+                "jobs": RedisJobQuota(self.redis, key + "jobs", max_len=role['quota']['jobs'], jobs=jobs,
+                                      ttl=store['ttl']),
+            }
+            return
+
         self.quotas[sid] = {
             "role": role,
+            "owner": owner,
             "requests": Quota(max_len=role['quota']['requests'], interval=quotaInterval),
             "results": Quota(max_len=role['quota']['results'], interval=quotaInterval),
-            "jobs": JobQuota(max_len=role['quota']['jobs']),
+            "jobs": JobQuota(max_len=role['quota']['jobs'], jobs=jobs),
         }
 
+    def get_role(self, sid, default="guest"):
+        """
+        Get the name of the current role of a client (without db lookup)
+        :param sid: session id
+        :param default: role if the client is not connected
+        :return: name of the role
+        """
+        if sid in self.quotas:
+            return self.quotas[sid]["role"]["name"]
+        return default
+
     def get(self, sid):
         """
         Get client by sid
         :param sid: session id
         :return:
         """
+        pending = self._pending(sid)
+        if pending is not None:
+            return dict(pending)
         client = results(self.collection.find({"sid": sid, "connected": True}))
         if client.count() > 0:
             return client.next()
@@ -110,6 +313,10 @@ class Clients(Collection):
         :param sid: session id
         :return:
         """
+        pending = self._pending(sid)
+        if pending is not None:
+            self.write_behind.put({**pending, 'last_contact': datetime.now().isoformat(), 'secret': secret})
+            return
         self.collection.update_match({"sid": sid, "connected": True},
                              {'last_contact': datetime.now().isoformat(), 'secret': secret})
 
@@ -121,9 +328,12 @@ class Clients(Collection):
         """
         # update quota if role changed
         if "role" in client:
-            if self.quotas[client["sid"]]["role"] != client["role"]:
-                self._apply_quota(client["sid"], client["role"])
+            if self.quotas[client["sid"]]["role"]["name"] != client["role"]:
+                self._apply_quota(client["sid"], client["role"], owner=client.get("user"))
 
+        if self._pending(client["sid"]) is not None:
+            self.write_behind.put(client)
+            return
         self.collection.update(client)
 
     def quota(self, sid, append=False, is_result=False, is_job=False):
@@ -135,13 +345,24 @@ class Clients(Collection):
         :param append: append to quota
         :return: True if quota is exceeded
         """
-        self.collection.update_match({"sid": sid, "connected": True}, {'last_contact': datetime.now().isoformat()})
+        if self._pending(sid) is None:
+            self.collection.update_match({"sid": sid, "connected": True}, {'last_contact': datetime.now().isoformat()})
         if is_result:
             return self.quotas[sid]['results'](append)
         elif is_job:
             return self.quotas[sid]['jobs'](append)
         return self.quotas[sid]['requests'](append)
 
+    def _pending(self, sid):
+        """
+        Get a client that is not inserted yet (batched inserts during a reconnect storm)
+        :param sid: session id
+        :return: client document or None
+        """
+        if self.write_behind is None:
+            return None
+        return self.write_behind.get(sid)
+
     def clean(self):
         """
         Clean up old clients and reset quota
@@ -70,11 +70,12 @@ class Roles(Collection):
         :param force: force reload from db
         :return:
         """
-        if force or len(self.cache) == 0:
+        if force:
             roles = results(self.collection.find({"name": name}))
             if roles.count() > 0:
                 return roles.next()
         else:
+            self.get_all()
             role = [role for role in self.cache if role['name'] == name]
             if len(role) > 0:
                 return role[0]
@@ -1,7 +1,11 @@
+import threading
+import time
 from datetime import datetime
 
 from broker.db.collection import Collection
 from broker.db.utils import results
+from broker.utils.Routing import Routing
+from broker.utils.SkillCatalog import SkillCatalog
 
 
 class Skills(Collection):
@@ -10,13 +14,50 @@ class Skills(Collection):
 
     @author: Dennis Zyska
     """
+    # options of a skill config that can differ between the nodes of a skill
+    node_options = ['capacity', 'slots']
+    indexes = [
+        ("connected_name_index", ["connected", "config.name"]),  # get_skill, get_skills, get_skill_config, clean
+    ]
+    obsolete_indexes = ["sid_index", "connected_index"]  # skills are updated by key, connected is covered
+    queries = {
+        "get_skills": """
+            FOR doc IN @@collection
+            FILTER doc.connected == true
+            FILTER @name == null OR doc.config.name == @name
+            FILTER @role == null OR @role == 'admin'
+                or !HAS(doc.config, 'roles')
+                or LENGTH(doc.config.roles) == 0
+                or @role IN doc.config.roles
+            COLLECT name = doc.config.name WITH COUNT INTO nodes
+            RETURN { name: name, nodes: nodes }
+        """,
+        "get_skill_config": """
+            FOR doc IN @@collection
+            FILTER doc.connected == true
+            FILTER doc.config.name == @name
+            LIMIT 1
+            RETURN doc.config
+        """,
+    }
 
     def __init__(self, db, adb, config, socketio):
         super().__init__("skills", db, adb, config, socketio)
         self.quotas = {}
-
-        self.index = results(self.collection.add_hash_index(fields=['sid'], name='sid_index', unique=False))
-        self.index = results(self.collection.add_hash_index(fields=['connected'], name='connected_index', unique=False))
+        self.routing = Routing(config)
+        self.catalog = SkillCatalog(self.routing, self.node_options)
+
+        # changed skills since the last skillUpdate (skill name -> roles)
+        self.changes = {}
+        self.version = 0  # catalog version of the last skillUpdate
+        self.snapshots = {}  # (role, with_config) -> (version, skills)
+        self.interval = config['skillUpdates']['interval'] if 'skillUpdates' in config else 0
+        self.lock = threading.Lock()
+        self.trigger = threading.Event()
+        if self.interval > 0:
+            update_thread = threading.Thread(target=self.run_updates)
+            update_thread.daemon = True
+            update_thread.start()
 
     def register(self, sid, data):
         """
@@ -25,10 +66,9 @@ class Skills(Collection):
         :param sid: session id of skill node
         :param data: skill data
         """
-        skills = self.get_skills(filter_name=data['name'], with_config=True)
-        if len(skills) > 0:
-            print(skills)
-            if not skills[0]['config'] == data:
+        skill = self.catalog.get(data['name'], with_config=True)
+        if skill is not None:
+            if not skill['config'] == self.shared_config(data):
                 self.socketio.emit("error", {"code": 201}, to=sid)
                 return
 
@@ -42,86 +82,126 @@ class Skills(Collection):
             "first_contact": datetime.now().isoformat(),
         }
 
-        results(self.collection.insert(
+        skill['_key'] = results(self.collection.insert(
             skill
-        ))
+        ))['_key']
+        self.routing.add(skill)
+        self.catalog.add(skill)
         self.send_update(skill['config']['name'])
 
+        # dispatch pending requests to the new node
+        self.db.tasks.drain(skill['config']['name'])
+
     def unregister(self, sid):
         """
         Unregister all skills from a node
 
         :param sid: session id of skill node
         """
-        skills = results(self.collection.find({"sid": sid, "connected": True}))
-        for skill in skills:
+        for skill in self.routing.remove(sid):
+            self.catalog.remove(skill)
+
             # send update first
             self.send_update(skill['config']['name'], config=skill['config'])
 
-            skill["connected"] = False
-            skill["last_contact"] = datetime.now().isoformat()
-            results(self.collection.update(skill))
+            results(self.collection.update({
+                "_key": skill['_key'],
+                "connected": False,
+                "last_contact": datetime.now().isoformat(),
+            }))
+
+    def shared_config(self, config):
+        """
+        Config of a skill without the options of a single node
+        :param config: skill config
+        :return: config
+        """
+        return self.catalog.client_config(config)
 
-    def send_update(self, skill_name, config=None, **kwargs):
+    def send_update(self, skill_name, config=None):
         """
-        Send update to all connected clients
+        Send update of a skill to all connected clients
 
-        If name is given, only send update for this skill
+        Changes are collected for skillUpdates.interval seconds and sent as one delta (see flush_updates)
 
         :param skill_name: name of the skill
         :param config: config of the skill (for disconnect)
-        :param kwargs: additional arguments for socketio.emit
         """
-        nodes = 0
-        skill = self.get_skills(filter_name=skill_name, with_config=True if config is None else False)
-        if len(skill) > 0:
-            nodes = skill[0]['nodes']
-            if 'config' in skill[0]:
-                config = skill[0]['config']
-        if config is not None and 'roles' in config and len(config['roles']) > 0:
-            for role in config['roles']:
-                self.socketio.emit("skillUpdate", [{"name": skill_name, "nodes": nodes}],
-                                   to="role:{}".format(role), **kwargs)
+        skill = self.catalog.get(skill_name, with_config=True)
+        if skill is not None:
+            config = skill['config']
+        with self.lock:
+            self.changes[skill_name] = config['roles'] if config is not None and 'roles' in config else []
+
+        if self.interval > 0:
+            self.trigger.set()
         else:
-            self.socketio.emit("skillUpdate", [{"name": skill_name, "nodes": nodes}], **kwargs)
+            self.flush_updates()
+
+    def run_updates(self):
+        """
+        Send collected skill updates (thread)
+        """
+        while True:
+            self.trigger.wait()
+            time.sleep(self.interval)
+            self.trigger.clear()
+            try:
+                self.flush_updates()
+            except Exception as e:
+                self.logger.error("Error while sending skill updates: {}".format(e))
+
+    def flush_updates(self):
+        """
+        Send all collected changes as one skillUpdate per role
+
+        The skillUpdate contains the changed skills available for the role (nodes 0 if the skill is gone)
+        and the catalog version {version, previous}. Every role gets the update (even without changes),
+        so a client can request a full list (skillGetAll) if previous is newer than its version.
+        """
+        with self.lock:
+            changes, self.changes = self.changes, {}
+            if len(changes) == 0:
+                return
+            version = self.catalog.version
+            meta = {"version": version, "previous": self.version}
+            self.version = version
+
+        nodes = {}
+        for name in changes:
+            skill = self.catalog.get(name)
+            nodes[name] = skill['nodes'] if skill is not None else 0
+
+        for role in self.db.roles.roles:
+            skills = [{"name": name, "nodes": nodes[name]} for name, roles in changes.items()
+                      if role == "admin" or len(roles) == 0 or role in roles]
+            self.socketio.emit("skillUpdate", (skills, meta), to="role:{}".format(role))
 
     def send_all(self, role, with_config=False, **kwargs):
         """
-        Send update to all connected clients
-        :param with_config:
+        Send all skills available for a role (from the in-memory catalog)
+        :param with_config: include the config of the skills
         :param role: filter skills for role
-        :param kwargs:
+        :param kwargs: additional arguments for socketio.emit
         :return:
         """
-        all_skills = self.get_skills(filter_role=role, with_config=with_config)
-
-        if all_skills:
-            self.socketio.emit("skillUpdate", all_skills, **kwargs)
+        snapshot = self.snapshots.get((role, with_config))
+        if snapshot is None or snapshot[0] != self.catalog.version:
+            # the same snapshot is used until the catalog changes (e.g., many clients connect at once)
+            snapshot = self.catalog.snapshot(role=role, with_config=with_config)
+            self.snapshots[(role, with_config)] = snapshot
+        version, all_skills = snapshot
+        self.socketio.emit("skillUpdate", (all_skills, {"version": version, "full": True}), **kwargs)
 
     def get_node(self, sid, name):
         """
-        Get a random node by name
+        Get a random node by name (from the in-memory routing table)
 
         :param name: Skill name
         :param sid: session id of the requested user
-        :return: random node id (session id)
-        """
-        user = self.db.clients.get(sid)
-        aql_query = """
-                FOR doc IN @@collection
-                FILTER doc.connected 
-                FILTER (!HAS("roles", doc.config) or @role IN doc.config.roles)
-                FILTER doc.config.name == @name
-                SORT RAND()
-                LIMIT 1
-                RETURN doc
-            """
-        cursor = results(
-            self._sysdb.aql.execute(aql_query, bind_vars={"@collection": self.name, "role": user["role"], "name": name},
-                                    count=True))
-
-        if cursor.count() > 0:
-            return cursor.next()
+        :return: random node (skill document)
+        """
+        return self.routing.get(name, self.db.clients.get_role(sid))
 
     def check_feature(self, key, feature, check_all=False):
         """
@@ -136,12 +216,16 @@ class Skills(Collection):
         if isinstance(feature, str):
             feature = [feature]
 
-        skill = self.get(key)
-        if 'features' in skill['config']:
+        skill = self.routing.skill(key)
+        if skill is None:
+            # node is not connected anymore
+            skill = self.get(key)
+        config = skill['config']
+        if 'features' in config:
             if check_all:
-                return all(f in skill['config']['features'] for f in feature)
+                return all(f in config['features'] for f in feature)
             else:
-                return any(f in skill['config']['features'] for f in feature)
+                return any(f in config['features'] for f in feature)
         else:
             return False
 
@@ -155,7 +239,7 @@ class Skills(Collection):
 
     def get_skills(self, filter_name=None, filter_role=None, with_config=False):
         """
-        Get list of skills (aggregated)
+        Get list of skills (aggregated, from the database - use the catalog for connected skills)
 
         :param with_config: with config
         :param filter_name: filter by name
@@ -163,31 +247,8 @@ class Skills(Collection):
         :return: list of skills
         """
         skills = []
-
-        filtering = {
-            "filter_name": "FILTER doc.config.name == @name"
-            if filter_name is not None else "",
-            "filter_role": "FILTER @role == 'admin'"
-                           "or !HAS(doc.config, 'roles') "
-                           "or LENGTH(doc.config.roles) == 0 "
-                           "or @role IN doc.config.roles"
-            if filter_role is not None else "",
-            "return": "RETURN { name: name, nodes: nodes }"
-        }
-        aql_query = """
-            FOR doc IN @@collection
-            FILTER doc.connected 
-            {filter_name}
-            {filter_role}
-            COLLECT name = doc.config.name, node = doc.config.name WITH COUNT INTO nodes
-            {return}
-        """.format(**filtering)
-        bind_vars = {"@collection": self.name}
-        if filter_name is not None:
-            bind_vars["name"] = filter_name
-        if filter_role is not None:
-            bind_vars["role"] = filter_role
-        cursor = results(self._sysdb.aql.execute(aql_query, bind_vars=bind_vars, count=True))
+        bind_vars = {"@collection": self.name, "name": filter_name, "role": filter_role}
+        cursor = results(self._sysdb.aql.execute(self.queries["get_skills"], bind_vars=bind_vars, count=True))
         for skill in cursor:
             if with_config:
                 skill["config"] = self.get_skill_config(skill['name'])
@@ -200,18 +261,11 @@ class Skills(Collection):
 
         :param name: Skill name
         """
-
-        aql_query = """
-                    FOR doc IN @@collection
-                    FILTER doc.connected 
-                    FILTER doc.config.name == @name
-                    RETURN doc
-                """
         bind_vars = {"@collection": self.name, "name": name}
-        cursor = results(self._sysdb.aql.execute(aql_query, bind_vars=bind_vars, count=True))
+        cursor = results(self._sysdb.aql.execute(self.queries["get_skill_config"], bind_vars=bind_vars, count=True))
         if cursor.count() > 0:
-            skill_data = cursor.next()
-            return skill_data["config"] if "config" in skill_data else {}
+            config = cursor.next()
+            return config if config is not None else {}
         else:
             return {}
 
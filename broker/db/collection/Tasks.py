@@ -1,4 +1,5 @@
 import asyncio
+import itertools
 import threading
 import time
 from datetime import datetime
@@ -6,6 +7,11 @@ from datetime import timedelta
 
 from broker.db.collection import Collection
 from broker.db.utils import results
+from broker.db.utils.BlobStore import BlobStore
+from broker.db.utils.WriteBehind import WriteBehind
+from broker.utils.Deadlines import Deadlines
+from broker.utils.ResultCache import ResultCache
+from broker.utils.TaskQueue import TaskQueue
 
 
 class Tasks(Collection):
@@ -14,20 +20,104 @@ class Tasks(Collection):
 
     @author: Dennis Zyska
     """
+    indexes = [
+        ("status_updated_index", ["status", "updated"]),  # scrub, clean
+        ("nid_status_index", ["nid", "status"]),  # terminate_by_disconnect (node)
+        ("rid_status_index", ["rid", "status"]),  # terminate_by_disconnect (client)
+        ("rid_request_index", ["rid", "request.id"]),  # abort_by_user
+    ]
+    obsolete_indexes = ["sid_index", "connected_index"]  # tasks have no sid or connected field
+    queries = {
+        "terminate_by_disconnect": """
+            FOR doc IN @@collection
+            FILTER (doc.status == "running" OR doc.status == "created")
+            AND (doc.nid == @sid OR doc.rid == @sid)
+            RETURN KEEP(doc, "_key", "rid", "nid", "skill", "status", "request", "batch", "cache", "start_timer")
+        """,
+        "abort_by_user": """
+            FOR doc IN @@collection
+            FILTER doc.rid == @rid
+            AND doc.request.id == @id
+            LIMIT 1
+            RETURN doc
+        """,
+        "scrub": """
+            FOR doc IN @@collection
+            FILTER doc.status IN ["finished", "aborted", "error"] AND doc.updated < @timestamp
+            FILTER (NOT HAS(doc.request.config, 'donate') || doc.request.config.donate == false)
+            LIMIT @batch
+            REMOVE doc IN @@collection
+            RETURN @blobs ? [OLD.request.data, OLD.result.data] : 1
+        """,
+        "clean": """
+            LET connected = (FOR client IN clients FILTER client.connected == true RETURN client.sid)
+            RETURN LENGTH(
+                FOR doc IN @@collection
+                FILTER doc.status IN ["running", "created"]
+                FILTER doc.nid NOT IN connected OR doc.rid NOT IN connected
+                UPDATE doc WITH {status: "aborted", reason: "broker restarted", cleaned: true} IN @@collection
+                RETURN 1
+            )
+        """,
+    }
 
     def __init__(self, db, adb, config, socketio):
+        # large request data and results are stored outside the task documents (claim-check),
+        # set before the scrub thread is started
+        self.blobs = None
+        if 'blobs' in config and config['blobs']['enabled']:
+            self.blobs = BlobStore(config['blobs']['path'], threshold=config['blobs']['threshold'])
+
         super().__init__("tasks", db, adb, config, socketio)
         self.quotas = {}
 
-        self.index = results(self.collection.add_hash_index(fields=['sid'], name='sid_index', unique=False))
-        self.index = results(self.collection.add_hash_index(fields=['connected'], name='connected_index', unique=False))
-
-        # start scrub task
-        scrub_thread = threading.Thread(target=self.cron)
-        scrub_thread.daemon = True
-        scrub_thread.start()
-
-    def create(self, sid, node, payload, parent=None):
+        # write-behind mode: task states are kept in memory and written in bulk
+        self.cache = {}
+        self.write_behind = None
+        if 'tasks' in self.config and self.config['tasks']['writeBehind']['enabled']:
+            write_behind = self.config['tasks']['writeBehind']
+            self.write_behind = WriteBehind(self.collection,
+                                            batch_size=write_behind['batchSize'],
+                                            interval=write_behind['interval'],
+                                            max_pending=write_behind['maxPending'])
+            self._keys = itertools.count(time.time_ns() // 1000)
+
+        # pending queue for requests without a free node (always used for nodes without credits)
+        queue_config = self.config['queue'] if 'queue' in self.config else {}
+        self.queue_enabled = queue_config.get('enabled', False)
+        self.queue = TaskQueue(max_depth=queue_config.get('maxDepth', 100),
+                               max_wait=queue_config.get('maxWait', 30))
+        queue_thread = threading.Thread(target=self.expire_queue)
+        queue_thread.daemon = True
+        queue_thread.start()
+
+        # results of deterministic skills (opt-in by skill config or request)
+        self.result_cache = None
+        if 'resultCache' in self.config and self.config['resultCache']['enabled']:
+            result_cache = self.config['resultCache']
+            self.result_cache = ResultCache(max_bytes=result_cache['maxBytes'],
+                                            ttl=result_cache['ttl'],
+                                            skills=result_cache.get('skills', {}))
+
+        # identical requests attach to the running task (single-flight, same opt-in as the result cache)
+        self.coalescing = 'coalescing' in self.config and self.config['coalescing']['enabled']
+        self.inflight = {}  # cache key -> task key
+        self.subscribers = {}  # task key -> list of waiting requests
+
+        # running streams of generative skills (task key -> receivers and time to first chunk)
+        self.streams = {}
+
+        # open batch requests with combined results
+        self.batches = {}
+        self._batch_keys = itertools.count(1)
+
+        # task killer: deadlines of running tasks by max_runtime
+        self.deadlines = Deadlines()
+        killer_thread = threading.Thread(target=self.cron)
+        killer_thread.daemon = True
+        killer_thread.start()
+
+    def create(self, sid, node, payload, parent=None, batch=None):
         """
         Create a new task
 
@@ -35,16 +125,65 @@ class Tasks(Collection):
         :param node: node id send request to
         :param payload: task payload
         :param parent: parent task id
+        :param batch: key of the batch request (combined results)
         :return:
         """
-        # is max_runtime set?
-        max_runtime = 0
-        if "config" in payload and 'max_runtime' in payload['config']:
-            max_runtime = payload['config']['max_runtime']
-        if self.config['taskKiller']['enabled']:
-            max_duration = self.config['taskKiller']['maxDuration']
-            if max_runtime > max_duration:
-                max_runtime = max_duration
+        return self.create_many(sid, [(node, payload)], parent=parent, batch=batch)[0]
+
+    def create_many(self, sid, tasks, parent=None, batch=None, acquire=True):
+        """
+        Create new tasks (inserted in bulk)
+
+        :param sid: sender id from request client
+        :param tasks: list of tuples (node, payload)
+        :param parent: parent task id
+        :param batch: key of the batch request (combined results)
+        :param acquire: count the tasks as outstanding for the nodes
+        :return: list of task ids
+        """
+        new_tasks = [self._new_task(sid, node, payload, parent, batch) for node, payload in tasks]
+        if self.write_behind:
+            for new_task in new_tasks:
+                new_task["_key"] = str(next(self._keys))
+                self.cache[new_task["_key"]] = new_task
+                self.write_behind.put(new_task)
+        else:
+            for new_task, meta in zip(new_tasks, results(self.collection.insert_many(new_tasks))):
+                if isinstance(meta, Exception):
+                    raise meta
+                new_task['_key'] = meta['_key']
+
+        task_ids = []
+        for (node, payload), new_task in zip(tasks, new_tasks):
+            if "config" in payload and 'simulate' in payload['config']:
+                if "output" in node['config'] and "example" in node['config']['output']:
+                    result = node['config']['output']['example']
+                else:
+                    result = {}
+                self.update(new_task['_key'], 0, result)
+                task_ids.append(0)
+            else:
+                if acquire:
+                    self.db.skills.routing.acquire(new_task['_key'], node['sid'])
+                if self.config['taskKiller']['enabled'] and self.max_runtime(payload) > 0:
+                    self.deadlines.add(new_task['_key'], self.max_runtime(payload))
+                if self.coalescing and new_task['cache']:
+                    self.inflight.setdefault(new_task['cache'], new_task['_key'])
+                task_ids.append(int(new_task['_key']))
+        return task_ids
+
+    def _new_task(self, sid, node, payload, parent=None, batch=None):
+        """
+        Task document for a new task
+
+        :param sid: sender id from request client
+        :param node: node id send request to
+        :param payload: task payload
+        :param parent: parent task id
+        :param batch: key of the batch request
+        :return: task document
+        """
+        max_runtime = self.max_runtime(payload)
 
         # is simulation set?
         if "config" in payload and 'simulate' in payload['config']:
@@ -52,29 +191,328 @@ class Tasks(Collection):
         else:
             node_key = node['_key']
 
-        new_task = results(self.collection.insert({
+        # key to store the results in the result cache (and to find identical running tasks)
+        cache_key = None
+        if (self.result_cache or self.coalescing) and ResultCache.enabled(node['config'], payload):
+            cache_key = ResultCache.key(payload['name'], payload['data'],
+                                        self.db.skills.shared_config(node['config']))
+
+        return {
             "rid": sid,  # request id
             "nid": node['sid'],  # node id
             "skill": node_key,  # node key
-            "request": payload,
+            "request": self.claim(payload),
             "status": "created",
             "parent": parent,
+            "batch": batch,
+            "cache": cache_key,
             "max_runtime": (datetime.now() + timedelta(
                 seconds=max_runtime)).isoformat() if max_runtime > 0 else "9999-12-31T23:59:59.000000",
             "start_timer": time.perf_counter(),
             "created": datetime.now().isoformat(),
             "updated": datetime.now().isoformat(),
-        }))
+        }
 
-        if "config" in payload and 'simulate' in payload['config']:
-            if "output" in node['config'] and "example" in node['config']['output']:
-                result = node['config']['output']['example']
-            else:
-                result = {}
-            self.update(new_task['_key'], 0, result)
-            return 0
-        else:
-            return int(new_task['_key'])
+    def max_runtime(self, payload):
+        """
+        Maximum runtime of a task (limited by the task killer)
+        :param payload: task payload
+        :return: seconds (0 for unlimited)
+        """
+        max_runtime = 0
+        if "config" in payload and 'max_runtime' in payload['config']:
+            max_runtime = payload['config']['max_runtime']
+        if self.config['taskKiller']['enabled']:
+            max_duration = self.config['taskKiller']['maxDuration']
+            if max_duration > 0 and (max_runtime <= 0 or max_runtime > max_duration):
+                max_runtime = max_duration
+        return max_runtime
+
+    def dispatch(self, sid, node, payload, reserved, batch=None):
+        """
+        Create a task and send it to the node
+
+        :param sid: sender id from request client
+        :param node: node to send the task to
+        :param payload: task payload
+        :param reserved: reserved job quota of the client
+        :param batch: key of the batch request
+        """
+        self.dispatch_many(sid, [(node, payload, reserved)], batch=batch)
+
+    def dispatch_many(self, sid, tasks, batch=None, acquired=False):
+        """
+        Create tasks in bulk and send them to the nodes
+
+        :param sid: sender id from request client
+        :param tasks: list of tuples (node, payload, reserved job quota)
+        :param batch: key of the batch request
+        :param acquired: the nodes were already acquired with the reserved job quota as key
+        """
+        task_ids = self.create_many(sid, [(node, payload) for node, payload, _ in tasks], batch=batch,
+                                    acquire=not acquired)
+
+        for (node, payload, reserved), task_id in zip(tasks, task_ids):
+            if acquired:
+                if task_id > 0:
+                    self.db.skills.routing.rekey(reserved, task_id)
+                else:
+                    self.db.skills.routing.release(reserved)
+
+            if task_id > 0:
+                self.socketio.emit("taskRequest", {'id': task_id, 'name': payload['name'],
+                                                   'data': self.db.clients.encode(node['sid'], payload['data'])},
+                                   room=node['sid'])
+
+            self.db.clients.quotas[sid]["jobs"].update(reserved, task_id)
+
+    def cached(self, sid, payload, batch=None):
+        """
+        Send the results of a request from the result cache
+
+        :param sid: sender id from request client
+        :param payload: request payload
+        :param batch: key of the batch request
+        :return: True if the results were cached and sent
+        """
+        if self.result_cache is None:
+            return False
+        start_timer = time.perf_counter()
+        key = self.cache_key(sid, payload)
+        cached = self.result_cache.get(key) if key is not None else None
+        if cached is None:
+            return False
+
+        output = {
+            'id': payload.get('id'),
+            'clientId': payload.get('clientId'),
+            'data': cached['data'],
+        }
+        if "config" in payload and 'return_stats' in payload['config']:
+            output['stats'] = {
+                'duration': time.perf_counter() - start_timer,
+                'host': None,
+                'cached': True,
+            }
+            if cached['stats'] is not None:
+                output['stats']['result'] = cached['stats']
+        self.send_results(sid, output, batch=batch)
+        return True
+
+    def cache_key(self, sid, payload):
+        """
+        Cache key of a request (see ResultCache)
+
+        :param sid: sender id from request client
+        :param payload: request payload
+        :return: key or None if the skill is not available or the request is not cacheable
+        """
+        config = self.db.skills.routing.skill_config(payload['name'], self.db.clients.get_role(sid))
+        if config is None or not ResultCache.enabled(config, payload):
+            return None
+        return ResultCache.key(payload['name'], payload['data'], self.db.skills.shared_config(config))
+
+    def coalesce(self, sid, payload, reserved, batch=None):
+        """
+        Attach a request to an identical running task (single-flight)
+
+        The request keeps its reserved job quota until the task is done.
+        :param sid: sender id from request client
+        :param payload: request payload
+        :param reserved: reserved job quota of the client
+        :param batch: key of the batch request
+        :return: True if the request waits for a running task
+        """
+        if not self.coalescing or len(self.inflight) == 0:
+            return False
+        key = self.cache_key(sid, payload)
+        if key is None or key not in self.inflight:
+            return False
+        self.subscribers.setdefault(self.inflight[key], []).append({
+            "sid": sid,
+            "payload": payload,
+            "reserved": reserved,
+            "batch": batch,
+        })
+        return True
+
+    def unsubscribe(self, sid, id=None):
+        """
+        Remove waiting requests of a client from running tasks
+
+        :param sid: session id of the request client
+        :param id: request id (all requests of the client if None)
+        :return: list of removed requests
+        """
+        removed = []
+        for task_key in list(self.subscribers):
+            subscribers = self.subscribers[task_key]
+            removed.extend(s for s in subscribers if s['sid'] == sid and (id is None or s['payload'].get('id') == id))
+            subscribers[:] = [s for s in subscribers if s not in removed]
+            if len(subscribers) == 0:
+                del self.subscribers[task_key]
+        for subscriber in removed:
+            if sid in self.db.clients.quotas:
+                self.db.clients.quotas[sid]["jobs"].remove(subscriber['reserved'])
+        return removed
+
+    def detach(self, task):
+        """
+        Task is done, remove it from the running tasks
+
+        :param task: task document
+        :return: list of waiting requests
+        """
+        if task.get('cache') and self.inflight.get(task['cache']) == task['_key']:
+            del self.inflight[task['cache']]
+        subscribers = self.subscribers.pop(task['_key'], [])
+        for subscriber in subscribers:
+            if subscriber['sid'] in self.db.clients.quotas:
+                self.db.clients.quotas[subscriber['sid']]["jobs"].remove(subscriber['reserved'])
+        return subscribers
+
+    def move(self, task, task_id):
+        """
+        Waiting requests follow a task that is restarted as a new task
+
+        :param task: task document of the previous task
+        :param task_id: id of the new task
+        """
+        if task.get('cache') and self.inflight.get(task['cache']) == task['_key']:
+            self.inflight[task['cache']] = str(task_id)
+        if task['_key'] in self.subscribers:
+            self.subscribers[str(task_id)] = self.subscribers.pop(task['_key'])
+
+    def handover(self, task):
+        """
+        Pass a running task to the next waiting request instead of aborting it (requester is gone)
+
+        :param task: task document
+        :return: True if the task is continued for another client
+        """
+        subscribers = self.subscribers.get(task['_key'])
+        if not subscribers:
+            return False
+        subscriber = subscribers.pop(0)
+        if len(subscribers) == 0:
+            del self.subscribers[task['_key']]
+
+        if task['rid'] in self.db.clients.quotas:
+            self.db.clients.quotas[task['rid']]['jobs'].remove(task['_key'])
+        self.db.clients.quotas[subscriber['sid']]['jobs'].update(subscriber['reserved'], int(task['_key']))
+
+        task['rid'] = subscriber['sid']
+        task['request'] = self.claim(subscriber['payload'])
+        task['batch'] = subscriber['batch']
+        if task['_key'] in self.streams:
+            self.streams[task['_key']].update(rid=task['rid'], id=task['request'].get('id'),
+                                              clientId=task['request'].get('clientId'))
+        task['updated'] = datetime.now().isoformat()
+        self.save(task)
+        return True
+
+    def open_batch(self, sid, batch_id, size):
+        """
+        Open a batch request, results are sent together if all tasks are done
+
+        :param sid: sender id from request client
+        :param batch_id: id of the batch request given by the client
+        :param size: number of tasks in the batch
+        :return: key of the batch
+        """
+        key = next(self._batch_keys)
+        self.batches[key] = {"rid": sid, "id": batch_id, "open": size, "results": []}
+        return key
+
+    def close_batch(self, batch, output):
+        """
+        Add results (or an error) of a task to the batch and send all results if it is complete
+
+        :param batch: key of the batch
+        :param output: output of the task (as for skillResults or error)
+        """
+        if batch not in self.batches:
+            return
+        self.batches[batch]["results"].append(output)
+        self.batches[batch]["open"] -= 1
+        if self.batches[batch]["open"] <= 0:
+            batch = self.batches.pop(batch)
+            self.socketio.emit("skillResultsBatch", {"id": batch["id"], "results": batch["results"]},
+                               room=batch["rid"])
+
+    def drop_batches(self, sid):
+        """
+        Drop all open batches of a disconnected client (queued and running tasks of the batch are removed
+        or aborted, so the batches would never be complete)
+
+        :param sid: sender id from request client
+        """
+        for key in [k for k, b in self.batches.items() if b["rid"] == sid]:
+            del self.batches[key]
+
+    def queueable(self, sid, name):
+        """
+        Check if a request without a free node can wait in the pending queue
+        :param sid: sender id from request client
+        :param name: skill name
+        :return: True if the queue is enabled or all nodes of the skill are busy
+        """
+        return self.queue_enabled or self.db.skills.routing.has_nodes(name, self.db.clients.get_role(sid))
+
+    def enqueue(self, sid, payload, reserved, batch=None):
+        """
+        Add a request to the pending queue of the skill
+
+        :param sid: sender id from request client
+        :param payload: task payload
+        :param reserved: reserved job quota of the client
+        :param batch: key of the batch request
+        """
+        position = self.queue.put(payload['name'], sid, payload, reserved, batch=batch)
+        if position is None:
+            self.db.clients.quotas[sid]["jobs"].remove(reserved)
+            self.send_error(sid, payload, 204, batch=batch)
+            return
+
+        self.socketio.emit("taskQueued", {
+            'id': payload.get('id'),
+            'clientId': payload.get('clientId'),
+            'position': position,
+        }, to=sid)
+
+        # a node could have been freed in between
+        self.drain(payload['name'])
+
+    def drain(self, name):
+        """
+        Dispatch pending requests of a skill as long as there are free nodes
+
+        :param name: skill name
+        """
+        while True:
+            entry = self.queue.peek(name)
+            if entry is None:
+                return
+            node = self.db.skills.get_node(entry['sid'], name)
+            if node is None:
+                return
+            self.queue.pop(name)
+            try:
+                self.dispatch(entry['sid'], node, entry['payload'], entry['reserved'], **entry['options'])
+            except Exception as e:
+                self.logger.error("Error dispatching queued request {}: {}".format(entry['payload'], e))
+                self.send_error(entry['sid'], entry['payload'], 500, **entry['options'])
+
+    def expire_queue(self):
+        """
+        Regularly remove requests waiting too long in the pending queue
+        """
+        while True:
+            time.sleep(min(1, self.queue.max_wait) if self.queue.max_wait > 0 else 1)
+            for entry in self.queue.expired():
+                if entry['sid'] in self.db.clients.quotas:
+                    self.db.clients.quotas[entry['sid']]["jobs"].remove(entry['reserved'])
+                self.send_error(entry['sid'], entry['payload'], 205, **entry['options'])
 
     def update(self, key, node, data):
         """
@@ -84,10 +522,20 @@ class Tasks(Collection):
         :param data: results of task
         :param error: error occurred
         """
+        if isinstance(data, dict) and data.get('status') == 'stream':
+            self.stream(key, node, data)
+            return
+
         task = self.get(key)
         if task is None:
             self.socketio.emit("error", {'id': key, 'code': 108}, room=node)
             return
+        if task['status'] == "aborted":
+            # late results of an aborted task, the node has a free slot again
+            self.db.skills.routing.release(task['_key'])
+            self.drain(task['request']['name'])
+            self.socketio.emit("error", {'id': key, 'code': 108}, room=node)
+            return
 
         # if simulate task has set an integer value, wait for this time
         if "config" in task['request'] and 'simulate' in task['request']['config']:
@@ -98,8 +546,14 @@ class Tasks(Collection):
             task['status'] = 'error'
             task['error'] = data['error']
             task['updated'] = datetime.now().isoformat()
-            self.collection.update(task)
+            self.save(task, done=True)
             self.socketio.emit("error", {'id': key, 'code': 112, 'error': data['error']}, room=task['rid'])
+            if task.get('batch'):
+                self.close_batch(task['batch'], {'id': task['request'].get('id'),
+                                                 'clientId': task['request'].get('clientId'),
+                                                 'error': {'code': 112, 'error': data['error']}})
+            for subscriber in self.detach(task):
+                self.send_error(subscriber['sid'], subscriber['payload'], 112, batch=subscriber['batch'])
             return
 
         if ('status' in data
@@ -140,19 +594,29 @@ class Tasks(Collection):
                     # sending status update to client
                     self.socketio.emit("skillStatus", output, room=task['rid'])
 
-            self.collection.update(task)
+            self.save(task)
 
         else:
             task['end_timer'] = time.perf_counter()
             task["duration"] = task['end_timer'] - task["start_timer"]
-            task["result"] = data
+            task["result"] = self.claim(data)
             task['status'] = 'finished'
             task["fid"] = node  # finish id
-            self.collection.update(task)
+            stream = self.streams.get(task['_key'])
+            if stream is not None:
+                task['ttft'] = stream['ttft']
+                task['chunks'] = stream['chunks']
+            self.save(task, done=True)
 
             # update job quota
             self.db.clients.quotas[task['rid']]['jobs'].remove(task['_key'])
 
+            if task.get('cache') and self.result_cache:
+                self.result_cache.put(task['cache'], task['request']['name'], {
+                    'data': data['data'] if isinstance(data, dict) and 'data' in data.keys() else {},
+                    'stats': data['stats'] if 'stats' in data else None,
+                })
+
             output = {
                 'id': task['request']['id'],
                 'clientId': task['request']['clientId'] if 'clientId' in task['request'] else None,
@@ -163,6 +627,8 @@ class Tasks(Collection):
                     'duration': task["duration"],
                     'host': node,
                 }
+                if 'ttft' in task:
+                    output['stats']['ttft'] = task['ttft']
                 if 'stats' in data:
                     output['stats']['result'] = data['stats']
 
@@ -178,38 +644,94 @@ class Tasks(Collection):
                         asyncio.sleep(
                             task['request']['config']['min_delay'] - (time.perf_counter() - task["start_timer"])))
                     tsk.add_done_callback(
-                        lambda t: self.send_results(task['rid'], output))
+                        lambda t: self.send_results(task['rid'], output, batch=task.get('batch')))
                 else:
                     asyncio.run(
                         asyncio.sleep(
                             task['request']['config']['min_delay'] - (time.perf_counter() - task["start_timer"])))
-                    self.send_results(task['rid'], output)
+                    self.send_results(task['rid'], output, batch=task.get('batch'))
             else:
-                self.send_results(task['rid'], output)
+                self.send_results(task['rid'], output, batch=task.get('batch'))
+
+            # identical requests get the same results
+            for subscriber in self.detach(task):
+                payload = subscriber['payload']
+                subscriber_output = {**output, 'id': payload.get('id'), 'clientId': payload.get('clientId')}
+                subscriber_output.pop('stats', None)
+                if "config" in payload and 'return_stats' in payload['config']:
+                    subscriber_output['stats'] = {
+                        'duration': task["duration"],
+                        'host': node,
+                        'coalesced': True,
+                    }
+                    if 'stats' in data:
+                        subscriber_output['stats']['result'] = data['stats']
+                self.send_results(subscriber['sid'], subscriber_output, batch=subscriber['batch'])
 
             return {
                 "rid": task["rid"],
                 "output": output,
             }
 
-    def cron(self):
+    def streaming(self, data):
         """
-        Cronjob for cleaning up tasks
+        Check if results are a chunk of an already running stream
+        :param data: results of a task
+        :return: True if the stream was started before
         """
-        # arango.exceptions.AQLQueryExecuteError: [HTTP 400][ERR 600] VPackError error: Expecting digit
-        # or arango.exceptions.AsyncJobStatusError: [HTTP 404][ERR 404] job 258578 not found
-        return False
+        return isinstance(data, dict) and data.get('status') == 'stream' and str(data.get('id')) in self.streams
+
+    def stream(self, key, node, data):
+        """
+        Relay a chunk of a streaming skill to the client (and the waiting identical requests)
+
+        The task document is only read for the first chunk, the chunks are not stored.
+        :param key: key of task
+        :param node: node the chunk came from
+        :param data: chunk (status stream)
+        """
+        stream = self.streams.get(str(key))
+        if stream is None:
+            task = self.get(key)
+            if task is None or task['nid'] != node or task['status'] not in ["running", "created"]:
+                self.socketio.emit("error", {'id': key, 'code': 108}, room=node)
+                return
+            stream = self.streams[task['_key']] = {
+                "nid": task['nid'],
+                "rid": task['rid'],
+                "id": task['request'].get('id'),
+                "clientId": task['request'].get('clientId'),
+                "ttft": time.perf_counter() - task['start_timer'],
+                "chunks": 0,
+            }
+        elif stream['nid'] != node:
+            self.socketio.emit("error", {'id': key, 'code': 108}, room=node)
+            return
+
+        output = {'id': stream['id'], 'clientId': stream['clientId'], 'index': stream['chunks'], 'data': data['data']}
+        self.socketio.emit("skillStream", output, room=stream['rid'])
+        for subscriber in self.subscribers.get(str(key), []):
+            self.socketio.emit("skillStream", {**output, 'id': subscriber['payload'].get('id'),
+                                               'clientId': subscriber['payload'].get('clientId')},
+                               room=subscriber['sid'])
+        stream['chunks'] += 1
+
+    def cron(self):
+        """
+        Task killer: abort tasks running longer than their max_runtime
 
-        while self.config['taskKiller']['enabled']:
-            aql_query = "FOR doc IN @@collection " \
-                        "FILTER (doc.status == 'running' OR doc.status == 'created') " \
-                        "RETURN doc"
-            # FILTER doc.status == 'running' or doc.status == 'created'
-            # FILTER doc.max_runtime < DATE_NOW()
-            cursor = self.db.sync_db.aql.execute(aql_query, bind_vars={"@collection": self.name}, count=True)
-            for task in cursor:
-                self.abort(task)
+        The deadlines are kept in memory (registered on create), so the collection is never scanned.
+        """
+        while True:
             time.sleep(self.config['taskKiller']['interval'])
+            for key in self.deadlines.expired():
+                try:
+                    task = self.get(key)
+                    if task is not None and task['status'] not in ["finished", "aborted", "error"]:
+                        self.logger.info("Kill task {} - maximum runtime exceeded".format(key))
+                        self.abort(task, reason="maximum runtime exceeded", kill=True, error=102)
+                except Exception as e:
+                    self.logger.error("Error killing task {}: {}".format(key, e))
 
     def terminate_by_disconnect(self, sid):
         """
@@ -217,17 +739,19 @@ class Tasks(Collection):
         :param sid: session id of user
         :return:
         """
-        aql_query = """
-                FOR doc IN @@collection
-                FILTER (doc.status == "running" OR doc.status == "created")
-                AND (doc.nid == @sid OR doc.rid == @sid)
-                RETURN doc
-            """
-        cursor = results(self._sysdb.aql.execute(aql_query, bind_vars=
-        {
-            "@collection": self.name,
-            "sid": sid
-        }))
+        if self.write_behind:
+            cursor = [task for task in list(self.cache.values())
+                      if task['status'] in ["running", "created"] and (task['nid'] == sid or task['rid'] == sid)]
+        else:
+            # only the fields needed to abort or restart the task (partial update on save)
+            cursor = results(self._sysdb.aql.execute(self.queries["terminate_by_disconnect"], bind_vars={
+                "@collection": self.name,
+                "sid": sid
+            }))
+
+        # requests waiting for identical tasks
+        self.unsubscribe(sid)
+
         for task in cursor:
             if task['nid'] == sid:
                 # node disconnected, is there another node?
@@ -236,11 +760,19 @@ class Tasks(Collection):
                     self.abort(task, reason="node disconnected", kill=False, error=103)
                 else:
                     # start task on other node
-                    task = self.db.tasks.create(task["rid"], node, task['request'], parent=task['_key'])
-                    self.socketio.emit("taskRequest", {'id': task['_key'], 'data': task['request']['data']}, room=node)
+                    payload = self.unclaim(task['request'])
+                    task_id = self.create(task["rid"], node, payload, parent=task['_key'], batch=task.get('batch'))
+                    self.socketio.emit("taskRequest", {
+                        'id': task_id, 'name': payload['name'],
+                        'data': self.db.clients.encode(node['sid'], payload['data'])}, room=node['sid'])
+                    task['batch'] = None  # batch results are sent by the new task
+                    self.move(task, task_id)
                     self.abort(task, reason="node disconnected", kill=False, error=104)
+                    self.db.clients.quotas[task['rid']]['jobs'].append(task_id)
             else:
-                # client disconnected
+                # client disconnected, continue the task if identical requests are waiting
+                if self.handover(task):
+                    continue
                 if self.db.skills.check_feature(task['skill'], feature=['kill', 'abort'], check_all=False):
                     self.abort(task, reason="client disconnected", kill=True, error=False)
 
@@ -251,19 +783,33 @@ class Tasks(Collection):
         :param sid: session id of user
         :return:
         """
-        cursor = results(self._sysdb.aql.execute("""
-            FOR doc IN @@collection
-            FILTER doc.rid == @rid 
-            AND doc.request.id == @id
-            LIMIT 1
-            RETURN doc
-        """, bind_vars={
-            "@collection": self.name,
-            "rid": sid,
-            "id": id
-        }, count=True))
-        if cursor.count() > 0:
-            task = cursor.next()
+        # request is waiting for an identical task
+        if len(self.unsubscribe(sid, id)) > 0:
+            self.socketio.emit("error", {"code": 109}, room=sid)
+            return True
+
+        task = None
+        if self.write_behind:
+            task = next((t for t in list(self.cache.values()) + self.write_behind.values()
+                         if t['rid'] == sid and t['request'].get('id') == id), None)
+        if task is None:
+            cursor = results(self._sysdb.aql.execute(self.queries["abort_by_user"], bind_vars={
+                "@collection": self.name,
+                "rid": sid,
+                "id": id
+            }, count=True))
+            if cursor.count() > 0:
+                task = cursor.next()
+        if task is not None:
+            if task['status'] not in ["finished", "aborted", "error"] and task['_key'] in self.subscribers:
+                # identical requests are waiting, only the requester is removed
+                batch, request = task.get('batch'), task['request']
+                if self.handover(task):
+                    self.socketio.emit("error", {"code": 109}, room=sid)
+                    if batch:
+                        self.close_batch(batch, {'id': request.get('id'), 'clientId': request.get('clientId'),
+                                                 'error': {'code': 109, 'reason': ""}})
+                    return True
             if self.db.skills.check_feature(task['skill'], feature=['kill', 'abort'], check_all=False):
                 if task['status'] == "finished" or task['status'] == "aborted":
                     self.socketio.emit("error", {"code": 105}, room=sid)
@@ -290,55 +836,154 @@ class Tasks(Collection):
         # update job quota
         self.db.clients.quotas[task['rid']]['jobs'].remove(task['_key'])
 
-        # update task
+        # update task (the slot of the node stays used until it reports the task, unless the node can kill it)
         task['status'] = "aborted"
         task['reason'] = reason
         task['updated'] = datetime.now().isoformat()
-        self.collection.update(task)
+        self.save(task, done=True,
+                  release=not kill or self.db.skills.check_feature(task['skill'], feature=['kill', 'abort']))
 
         # send results to client
         if error:
             self.socketio.emit("error", {"code": error}, room=task['rid'])
+        if task.get('batch'):
+            self.close_batch(task['batch'], {'id': task['request'].get('id'),
+                                             'clientId': task['request'].get('clientId'),
+                                             'error': {'code': error if error else 110, 'reason': reason}})
+        for subscriber in self.detach(task):
+            self.send_error(subscriber['sid'], subscriber['payload'], error if error else 110,
+                            batch=subscriber['batch'])
+
+    def claim(self, payload):
+        """
+        Replace large data of a request or result by a reference to the blob store
+        :param payload: request or result with data
+        :return: payload for the task document
+        """
+        if self.blobs is None or not isinstance(payload, dict) or 'data' not in payload:
+            return payload
+        return {**payload, 'data': self.blobs.put(payload['data'])}
 
-    def send_results(self, rid, payload):
+    def unclaim(self, payload):
+        """
+        Load the data of a request or result from the blob store
+        :param payload: request or result of a task document
+        :return: payload with data
+        """
+        if self.blobs is None or not isinstance(payload, dict) or 'data' not in payload:
+            return payload
+        return {**payload, 'data': self.blobs.get(payload['data'])}
+
+    def get(self, key):
+        """
+        Get task by key (from memory in write-behind mode)
+        :param key: task key
+        :return:
+        """
+        if self.write_behind:
+            task = self.cache.get(str(key)) or self.write_behind.get(str(key))
+            if task is not None:
+                return task
+        return super().get(key)
+
+    def save(self, task, done=False, release=True):
+        """
+        Save the current state of a task
+        :param task: task document
+        :param done: task reached its final state (removed from memory in write-behind mode)
+        :param release: the node has a free slot again (if done)
+        """
+        if done:
+            if release:
+                self.db.skills.routing.release(task['_key'])
+            self.streams.pop(task['_key'], None)
+            self.deadlines.remove(task['_key'])
+
+        if self.write_behind:
+            self.write_behind.put(task)
+            if done:
+                self.cache.pop(task['_key'], None)
+        else:
+            self.collection.update(task)
+
+        # node has a free slot again
+        if done:
+            self.drain(task['request']['name'])
+
+    def send_results(self, rid, payload, batch=None):
         """
         Send results to request client
         :param rid: session id of request client
         :param payload: data to send
+        :param batch: key of the batch request (results are sent together)
         :return:
         """
-        self.socketio.emit("skillResults", payload, room=rid)
+        if 'data' in payload:
+            payload = {**payload, 'data': self.db.clients.encode(rid, payload['data'])}
+        if batch:
+            self.close_batch(batch, payload)
+        else:
+            self.socketio.emit("skillResults", payload, room=rid)
+
+    def send_error(self, rid, payload, code, batch=None):
+        """
+        Send an error for a request that did not become a task
+        :param rid: session id of request client
+        :param payload: request payload
+        :param code: error code
+        :param batch: key of the batch request
+        """
+        if batch:
+            self.close_batch(batch, {'id': payload.get('id'), 'clientId': payload.get('clientId'),
+                                     'error': {'code': code}})
+        else:
+            self.socketio.emit("error", {"id": payload.get('id'), "code": code}, to=rid)
 
     def clean(self):
         """
-        Clean up tasks on start
+        Clean up tasks on start (tasks of the previous run can not finish anymore)
+
+        Only tasks of disconnected nodes or clients are aborted, so the tasks of other running broker processes
+        are kept (the clients collection is cleaned before).
         """
-        cleaned = results(self.collection.update_match({"connected": True}, {"connected": False, "cleaned": True}))
-        self.logger.info("Cleaned up {} tasks".format(cleaned))
+        cleaned = results(self._sysdb.aql.execute(self.queries["clean"], bind_vars={"@collection": self.name}))
+        self.logger.info("Cleaned up {} tasks".format(next(cleaned, 0)))
 
     def scrub(self, run_forever=True):
         """
         Regular task for cleaning db - delete old entries
+
+        Finished tasks are removed in bounded chunks by a single AQL REMOVE (using the status_updated index).
         :param run_forever: run forever as called in thread
-        :param max_age: overwrite max age threshold and force scrub
-        :return:
+        :return: number of removed tasks (last run)
         """
+        removed = 0
         once = True
         while run_forever or once:
-            aql_query = """
-                FOR doc IN tasks
-                FILTER doc.status != 'running' && doc.status != 'created'
-                FILTER doc.updated < @timestamp
-                FILTER (NOT HAS(doc.request.config, 'donate') || doc.request.config.donate == false)
-                RETURN doc
-            """
             if self.config['scrub']['enabled'] and self.config['scrub']['maxAge'] > 0:
+                start = time.perf_counter()
                 timestamp_threshold = datetime.now() - timedelta(seconds=self.config['scrub']['maxAge'])
-                query_params = {'timestamp': timestamp_threshold.isoformat()}
-                cursor = results(self._sysdb.aql.execute(aql_query, bind_vars=query_params))
-                for entry in cursor:
-                    print("Delete by scrub: Task {}".format(entry['_key']))
-                    self.collection.delete(entry['_key'])
+                bind_vars = {
+                    "@collection": self.name,
+                    "timestamp": timestamp_threshold.isoformat(),
+                    "batch": self.config['scrub'].get('batchSize', 1000),
+                    "blobs": self.blobs is not None,  # return the blob references of removed tasks
+                }
+                removed = 0
+                while True:
+                    cursor = list(results(self._sysdb.aql.execute(self.queries["scrub"], bind_vars=bind_vars)))
+                    if self.blobs:
+                        for request_data, result_data in cursor:
+                            self.blobs.delete(request_data)
+                            self.blobs.delete(result_data)
+                    removed += len(cursor)
+                    if len(cursor) < bind_vars['batch']:
+                        break
+                duration = time.perf_counter() - start
+                if removed > 0 or not run_forever:
+                    self.logger.info("Scrubbed {} tasks in {:.3f}s ({:.1f} tasks/s)".format(
+                        removed, duration, removed / duration if duration > 0 else 0))
             if run_forever:
                 time.sleep(self.config['scrub']['interval'])
             once = False
+        return removed
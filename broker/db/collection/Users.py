@@ -2,7 +2,7 @@ from datetime import datetime
 
 from broker.db.utils import results
 from broker.db.collection import Collection
-from broker.utils.Keys import Keys
+from broker.utils.Keys import Keys, fingerprint
 
 from arango.exceptions import DocumentRevisionError
 
@@ -12,6 +12,9 @@ class Users(Collection):
 
     @author: Dennis Zyska
     """
+    indexes = [
+        ("fingerprint_index", ["fingerprint"]),  # auth, set_role (users are found by the fingerprint of their key)
+    ]
 
     def __init__(self, db, adb, config, socketio):
         super().__init__("users", db, adb, config, socketio)
@@ -48,6 +51,7 @@ class Users(Collection):
                         self.collection.delete(c)
 
                 c['key'] = keys.get_public()
+                c['fingerprint'] = fingerprint(c['key'])
                 c['updated'] = datetime.now().isoformat()
 
                 results(self.collection.update(c))
@@ -60,11 +64,26 @@ class Users(Collection):
                         "role": "admin",
                         "authenticated": 0,
                         "key": keys.get_public(),
+                        "fingerprint": fingerprint(keys.get_public()),
                         "created": datetime.now().isoformat(),
                         "updated": datetime.now().isoformat()
                     }
                 ))
 
+        # add fingerprints to users of previous versions
+        for user in results(self._sysdb.aql.execute(
+                "FOR doc IN @@collection FILTER !HAS(doc, 'fingerprint') RETURN {_key: doc._key, key: doc.key}",
+                bind_vars={"@collection": self.name})):
+            results(self.collection.update({"_key": user['_key'], "fingerprint": fingerprint(user['key'])}))
+
+    def find(self, public):
+        """
+        Find a user by public key (indexed by the fingerprint of the key)
+        :param public: public key
+        :return: cursor
+        """
+        return results(self.collection.find({"fingerprint": fingerprint(public), "key": public}, limit=1))
+
     def set_role(self, public, role):
         """
         Set a role to user
@@ -72,7 +91,7 @@ class Users(Collection):
         :param role: role name
         :return:
         """
-        client = results(self.collection.find({"key": public}, limit=1))
+        client = self.find(public)
         if client.count() > 0:
             c = client.next()
             c['role'] = role
@@ -87,7 +106,7 @@ class Users(Collection):
         :param data: public key and additional infos
         :return:
         """
-        client = results(self.collection.find({"key": public}, limit=1))
+        client = self.find(public)
         if client.count() > 0:
             c = client.next()
             c['authenticated'] = c['authenticated'] + 1
@@ -96,12 +115,13 @@ class Users(Collection):
                 return results(self.collection.update(c))
             except DocumentRevisionError as e:
                 self.logger.error(e)
-                return results(self.collection.get(c['key']))
+                return results(self.collection.get(c['_key']))
         else:
             return results(self.collection.insert(
                 {
                     "role": "user",
                     "key": public,
+                    "fingerprint": fingerprint(public),
                     "authenticated": 1,
                     "created": datetime.now().isoformat(),
                     "updated": datetime.now().isoformat()
@@ -1,3 +1,4 @@
+import re
 import threading
 
 from broker import init_logging
@@ -8,6 +9,9 @@ class Collection:
     """
     Representation of the database in the broker
     """
+    indexes = []  # persistent indexes derived from the queries (name, fields)
+    obsolete_indexes = []  # names of indexes dropped on startup
+    queries = {}  # AQL queries of the collection (name -> query), see explain
 
     def __init__(self, name, db, adb, config, socketio):
         self.name = name
@@ -30,6 +34,7 @@ class Collection:
             self.collection = self._sysdb.collection(self.name)
         else:
             self.collection = results(self._sysdb.create_collection(self.name))
+        self._init_indexes()
 
         # start scrub task
         scrub_thread = threading.Thread(target=self.scrub)
@@ -38,6 +43,49 @@ class Collection:
 
         return True
 
+    def _init_indexes(self):
+        """
+        Migrate the indexes of the collection (drop obsolete indexes, create missing or changed indexes)
+        """
+        existing = {index.get('name'): index for index in results(self.collection.indexes())}
+        for name in self.obsolete_indexes:
+            if name in existing:
+                self.logger.info("Drop obsolete index {}".format(name))
+                results(self.collection.delete_index(existing[name]['id']))
+        for name, fields in self.indexes:
+            if name in existing and existing[name]['fields'] != fields:
+                self.logger.info("Recreate index {} with fields {}".format(name, fields))
+                results(self.collection.delete_index(existing[name]['id']))
+            elif name in existing:
+                continue
+            results(self.collection.add_persistent_index(fields=fields, name=name, unique=False))
+
+    def explain(self):
+        """
+        Explain all queries of the collection (bind variables are replaced by example values)
+        :return: dict query name -> True if the query scans the full collection
+        """
+        scans = {}
+        for name, query in self.queries.items():
+            bind_vars = {var: self.name if var == "@collection" else 1 if var == "batch" else "explain"
+                         for var in set(re.findall(r"@(@?\w+)", query))}
+            plan = results(self._sysdb.aql.explain(query, bind_vars=bind_vars))
+            scans[name] = self._full_scan(plan['nodes'])
+        return scans
+
+    def _full_scan(self, nodes):
+        """
+        Check if an execution plan enumerates a whole collection (also in subqueries)
+        :param nodes: nodes of the execution plan
+        :return: True if there is a full collection scan
+        """
+        for node in nodes:
+            if node['type'] == "EnumerateCollectionNode":
+                return True
+            if 'subquery' in node and self._full_scan(node['subquery']['nodes']):
+                return True
+        return False
+
     def get(self, key):
         """
         Get entry by db key
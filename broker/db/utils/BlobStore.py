@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import re
+import uuid
+
+from broker import init_logging
+
+
+class BlobStore:
+    """
+    Claim-check store for large payloads in a local directory
+
+    Payloads with a json size above the threshold are written to a file,
+    the task document only keeps a reference {_blob, size, sha256}. Blob ids are random uuids (hex),
+    only valid ids are resolved to a file of the store.
+
+    @author: Dennis Zyska
+    """
+    BLOB_ID = re.compile(r"[0-9a-f]{32}")
+
+    def __init__(self, path, threshold=262144):
+        self.path = path
+        self.threshold = threshold
+        self.logger = init_logging("blobs")
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def is_ref(data):
+        """
+        Check if data is a reference to a blob
+        :param data: payload
+        :return: True if reference
+        """
+        return isinstance(data, dict) and len(data) == 3 and 'size' in data and 'sha256' in data \
+            and isinstance(data.get('_blob'), str) and BlobStore.BLOB_ID.fullmatch(data['_blob']) is not None
+
+    def put(self, data):
+        """
+        Store a payload if it is larger than the threshold
+        :param data: payload
+        :return: reference or data itself
+        """
+        if self.is_ref(data):
+            # references are only created by the broker
+            raise ValueError("Payload must not be a blob reference")
+        raw = json.dumps(data, separators=(',', ':')).encode("utf-8")
+        if len(raw) < self.threshold:
+            return data
+
+        blob = uuid.uuid4().hex
+        tmp = self._file(blob) + ".tmp"
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, self._file(blob))
+        return {'_blob': blob, 'size': len(raw), 'sha256': hashlib.sha256(raw).hexdigest()}
+
+    def get(self, data):
+        """
+        Load a payload
+        :param data: reference (or payload that was not stored)
+        :return: payload
+        """
+        if not self.is_ref(data):
+            return data
+        with open(self._file(data['_blob']), "rb") as f:
+            raw = f.read()
+        if hashlib.sha256(raw).hexdigest() != data['sha256']:
+            raise ValueError("Blob {} is corrupted".format(data['_blob']))
+        return json.loads(raw)
+
+    def delete(self, data):
+        """
+        Delete a blob
+        :param data: reference (ignored if it is not a reference)
+        """
+        if not self.is_ref(data):
+            return
+        try:
+            os.remove(self._file(data['_blob']))
+        except FileNotFoundError:
+            self.logger.warning("Blob {} not found".format(data['_blob']))
+
+    def _file(self, blob):
+        if not isinstance(blob, str) or self.BLOB_ID.fullmatch(blob) is None:
+            raise ValueError("Invalid blob id")
+        return os.path.join(self.path, blob[:2], blob)
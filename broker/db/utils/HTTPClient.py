@@ -0,0 +1,66 @@
+import re
+import threading
+import time
+
+from arango.http import DefaultHTTPClient
+
+
+class HTTPClient(DefaultHTTPClient):
+    """
+    HTTP client for the database connection
+
+    The number of concurrent requests is bounded by the pool size, additional calls wait for a free slot
+    (this also works with green threads of eventlet). If timing is enabled, the duration of each call is recorded.
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self, pool_size=10, timing=False):
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.timing = timing
+        self.stats = {}
+
+    def send_request(self, session, method, url, *args, **kwargs):
+        """
+        Send a request to the database (see arango.http.DefaultHTTPClient)
+        """
+        start = time.perf_counter()
+        with self.slots:
+            if not self.timing:
+                return super().send_request(session, method, url, *args, **kwargs)
+
+            acquired = time.perf_counter()
+            response = super().send_request(session, method, url, *args, **kwargs)
+            self._record(method, url, acquired - start, time.perf_counter() - acquired)
+            return response
+
+    def _record(self, method, url, wait, duration):
+        """
+        Record the timing of a call
+        :param method: http method
+        :param url: request url
+        :param wait: time waiting for a free slot
+        :param duration: duration of the call
+        """
+        match = re.search(r"/_api/([^/?]+)", url)
+        endpoint = "{} {}".format(method.upper(), match.group(1) if match else url)
+
+        if endpoint not in self.stats:
+            self.stats[endpoint] = {"calls": 0, "total": 0.0, "max": 0.0, "wait": 0.0}
+        stats = self.stats[endpoint]
+        stats["calls"] += 1
+        stats["total"] += duration
+        stats["max"] = max(stats["max"], duration)
+        stats["wait"] += wait
+
+    def get_stats(self, reset=False):
+        """
+        Get the recorded timings per endpoint
+        :param reset: reset timings after reading
+        :return: dict with calls, total, mean, max and wait time (in seconds) per endpoint
+        """
+        stats = {endpoint: dict(s, mean=s["total"] / s["calls"]) for endpoint, s in self.stats.items()}
+        if reset:
+            self.stats = {}
+        return stats
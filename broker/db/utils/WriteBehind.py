@@ -0,0 +1,105 @@
+import atexit
+import threading
+from collections import OrderedDict
+
+from broker import init_logging
+from broker.db.utils import results
+
+
+class WriteBehind:
+    """
+    Write-behind buffer for the documents of a collection
+
+    Changes are coalesced per document key (only the latest state is written) and stored in bulk
+    by a background thread, either if the batch size is reached or after the interval.
+    If more than max_pending documents are waiting, the caller writes them synchronously (backpressure).
+    The buffer is flushed on shutdown (atexit, the broker exits normally on SIGTERM and SIGINT).
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self, collection, batch_size=500, interval=0.5, max_pending=10000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.logger = init_logging("write-behind:{}".format(collection.name))
+
+        self.pending = OrderedDict()
+        self.writing = {}  # documents of a running flush (still readable until they are written)
+        self.lock = threading.Lock()
+        self.trigger = threading.Event()
+
+        flush_thread = threading.Thread(target=self.run)
+        flush_thread.daemon = True
+        flush_thread.start()
+        atexit.register(self.flush)
+
+    def put(self, doc):
+        """
+        Add the current state of a document (replaces older pending states of the same document)
+        :param doc: full document with _key
+        """
+        with self.lock:
+            self.pending[doc['_key']] = doc
+            pending = len(self.pending)
+
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self.trigger.set()
+
+    def get(self, key):
+        """
+        Get a document that is not written yet
+        :param key: document key
+        :return: document or None
+        """
+        doc = self.pending.get(key)
+        return doc if doc is not None else self.writing.get(key)
+
+    def values(self):
+        """
+        All documents that are not written yet
+        :return: list of documents
+        """
+        return list(self.pending.values())
+
+    def flush(self):
+        """
+        Write all pending documents to the database
+        :return: number of written documents
+        """
+        with self.lock:
+            docs = list(self.pending.values())
+            self.pending = OrderedDict()
+            self.writing.update((doc['_key'], doc) for doc in docs)
+
+        try:
+            for i in range(0, len(docs), self.batch_size):
+                batch = docs[i:i + self.batch_size]
+                try:
+                    results(self.collection.import_bulk(batch, on_duplicate="replace"))
+                except Exception as e:
+                    self.logger.error("Error writing {} documents: {}".format(len(batch), e))
+                    # keep documents for the next flush, if there is no newer state
+                    with self.lock:
+                        for doc in docs[i:]:
+                            self.pending.setdefault(doc['_key'], doc)
+                    return i
+            return len(docs)
+        finally:
+            with self.lock:
+                for doc in docs:
+                    if self.writing.get(doc['_key']) is doc:
+                        del self.writing[doc['_key']]
+
+    def run(self):
+        """
+        Background flusher (size or time trigger)
+        """
+        while True:
+            self.trigger.wait(self.interval)
+            self.trigger.clear()
+            if len(self.pending) > 0:
+                self.flush()
@@ -1,10 +1,17 @@
 import time
 
+from arango.job import AsyncJob
+
 
 def results(job):
-    """Return the job result of an arango db async operation.
+    """Return the job result of an arango db operation.
+
+    Results of synchronous calls are returned as they are, async jobs are polled until they are done.
     """
+    if not isinstance(job, AsyncJob):
+        return job
+
     while job.status() == "pending":
         time.sleep(0.01)
 
-    return job.result()
\ No newline at end of file
+    return job.result()
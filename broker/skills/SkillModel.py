@@ -58,6 +58,12 @@ class SkillModel(CLI):
             except docker.errors.NotFound:
                 print("Network not found.")
 
+            # number of concurrent tasks, dynamic batching and payload encoding per container
+            for arg, env in [("slots", "SKILL_SLOTS"), ("batch_size", "BATCH_SIZE"), ("batch_wait", "BATCH_WAIT"),
+                             ("serializer", "SERIALIZER")]:
+                if arg in args and getattr(args, arg) is not None:
+                    additional_parameter.setdefault("environment", {})[env] = getattr(args, arg)
+
             # Run the container
             for i in range(1, args.num_containers + 1):
                 container = client.containers.run(
@@ -9,6 +9,7 @@ Author: Dennis Zyska
 """
 
 import os
+import time
 
 from SkillSimple import SkillSimple
 from openai import AzureOpenAI
@@ -42,6 +43,8 @@ class Skill(SkillSimple):
         :param data:
         :return:
         """
+        if data.get('stream', False):
+            return self.stream(data)
         response = self.client.chat.completions.create(
             model=self.model,  # model = "deployment_name".
             messages=data['messages'],
@@ -66,6 +69,54 @@ class Skill(SkillSimple):
         # return None, None
         return output, stats
 
+    def stream(self, data):
+        """
+        Execute a request to the OpenAI API and yield the generated content chunk by chunk
+        :param data:
+        :return: generator of content chunks, returns the full output and stats at the end
+        """
+        start = time.perf_counter()
+        ttft = None
+        content = []
+        finish_reason = None
+        last = None
+        for chunk in self.client.chat.completions.create(
+                model=self.model,
+                messages=data['messages'],
+                stream=True,
+        ):
+            last = chunk
+            if len(chunk.choices) == 0:  # e.g., content filter results
+                continue
+            if chunk.choices[0].finish_reason is not None:
+                finish_reason = chunk.choices[0].finish_reason
+            if chunk.choices[0].delta.content:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                content.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+
+        output = {
+            "choices": [{
+                "finish_reason": finish_reason,
+                "index": 0,
+                "logprops": None,
+                "message": {"content": "".join(content), "role": "assistant",
+                            "function_call": None, "tool_calls": None}
+            }],
+        }
+
+        stats = {
+            "id": last.id if last else None,
+            "model": last.model if last else None,
+            "object": last.object if last else None,
+            "fingerprint": last.system_fingerprint if last else None,
+            "usage": None,
+            "ttft": ttft,
+            "chunks": len(content),
+        }
+        return output, stats
+
     def get_input(self):
         """
         Get the input schema
@@ -87,6 +138,11 @@ class Skill(SkillSimple):
                         }
                     },
                 },
+                'stream': {
+                    'type': 'boolean',
+                    'description': 'Send the generated content chunk by chunk (skillStream)',
+                    'required': False
+                },
             },
             'example': {
                 "messages": [
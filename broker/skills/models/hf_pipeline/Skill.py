@@ -31,6 +31,8 @@ class Skill(SkillSimple):
         self.pipe = None
         self.model = os.environ.get('MODEL') if os.environ.get('MODEL') != "" else self.yaml['pipeline']['model']
         self.task = self.yaml['pipeline']['task']
+        # inputs that can be batched, all other keys are parameters of the pipeline
+        self.inputs = [k for k, v in self.yaml['input']['data'].items() if v.get('type') == 'string']
 
     def init(self):
         """
@@ -50,6 +52,31 @@ class Skill(SkillSimple):
         response = self.pipe(**data)
         return response, None
 
+    def execute_batch(self, data):
+        """
+        Execute a batch of requests with the native batching of the pipeline
+
+        Requests with the same parameters are processed together.
+        :param data: list of data objects
+        :return: list of tuples (result object, stats)
+        """
+        groups = {}
+        for i, d in enumerate(data):
+            params = {k: v for k, v in d.items() if k not in self.inputs}
+            groups.setdefault(repr(sorted(params.items())), (params, []))[1].append(i)
+
+        outputs = [None] * len(data)
+        for params, indices in groups.values():
+            if len(indices) == 1:
+                outputs[indices[0]] = self.execute(data[indices[0]])
+                continue
+
+            inputs = {k: [data[i][k] for i in indices] for k in self.inputs if k in data[indices[0]]}
+            responses = self.pipe(**inputs, **params, batch_size=len(indices))
+            for i, response in zip(indices, responses):
+                outputs[i] = (response, None)
+        return outputs
+
     def get_input(self):
         """
         Get the input schema
@@ -8,6 +8,7 @@ Author: Dennis Zyska
 """
 
 import os
+import time
 
 from SkillSimple import SkillSimple
 from llama_cpp import Llama, LlamaGrammar
@@ -40,11 +41,45 @@ class Skill(SkillSimple):
         """
         if 'grammar' in data:
             data['grammar'] = LlamaGrammar.from_string(data['grammar'])
+        if data.get('stream', False):
+            return self.stream(data)
         response = self.client(data['prompt'], **data['params'])
 
         # return None, None
         return response, None
 
+    def stream(self, data):
+        """
+        Execute a request and yield the generated text chunk by chunk
+        :param data:
+        :return: generator of text chunks, returns the full completion and stats at the end
+        """
+        start = time.perf_counter()
+        ttft = None
+        text = []
+        last = None
+        params = {k: v for k, v in data.get('params', {}).items() if k != 'stream'}
+        for chunk in self.client(data['prompt'], stream=True, **params):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            text.append(chunk['choices'][0]['text'])
+            last = chunk
+            yield chunk['choices'][0]['text']
+
+        response = {
+            'id': last['id'] if last else None,
+            'object': 'text_completion',
+            'created': last['created'] if last else None,
+            'model': last['model'] if last else None,
+            'choices': [{
+                'text': "".join(text),
+                'index': 0,
+                'logprobs': None,
+                'finish_reason': last['choices'][0]['finish_reason'] if last else None,
+            }],
+        }
+        return response, {'ttft': ttft, 'chunks': len(text)}
+
     def get_input(self):
         """
         Get the input schema
@@ -65,6 +100,11 @@ class Skill(SkillSimple):
                     'type': 'string',
                     'required': False
                 },
+                'stream': {
+                    'type': 'boolean',
+                    'description': 'Send the generated text chunk by chunk (skillStream)',
+                    'required': False
+                },
             },
             'example': {
                 'prompt': 'Print Hello World',
@@ -24,6 +24,13 @@ class Skill(SkillSimple):
         """
         self.vader = SentimentIntensityAnalyzer()
 
+    def get_config(self):
+        """
+        Vader is deterministic, the results can be cached by the broker
+        :return: skill config
+        """
+        return {**super().get_config(), 'cacheable': True}
+
     def execute(self, data):
         """
         Execute a request to the OpenAI API
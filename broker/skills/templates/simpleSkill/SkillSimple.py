@@ -30,6 +30,16 @@ class SkillSimple:
         """
         return data, None
 
+    def execute_batch(self, data):
+        """
+        Execute the skill for a batch of tasks (used if BATCH_SIZE > 1)
+
+        Overwrite this method if the model supports batch processing.
+        :param data: list of data objects from the broker
+        :return: list of tuples (result object, stats), one for each data object
+        """
+        return [self.execute(d) for d in data]
+
     def get_input(self):
         """
         Get the input schema
@@ -1,6 +1,24 @@
+import io
+import tarfile
+
 import docker
 
 
+def build_context(path="./broker/skills/templates/simpleSkill"):
+    """
+    Build context of the container: the template and the modules shared with the broker
+    (the container is built without the broker package)
+    :param path: path of the template
+    :return: tar archive as file object
+    """
+    context = io.BytesIO()
+    with tarfile.open(fileobj=context, mode="w") as tar:
+        tar.add(path, arcname=".", filter=lambda info: None if "__pycache__" in info.name else info)
+        tar.add("./broker/utils/Compression.py", arcname="Compression.py")
+    context.seek(0)
+    return context
+
+
 def create_docker(nocache=False):
     """
     Build the docker container
@@ -13,7 +31,8 @@ def create_docker(nocache=False):
     try:
         build_logs = client.api.build(
             dockerfile="Dockerfile",
-            path="./broker/skills/templates/simpleSkill",
+            fileobj=build_context(),
+            custom_context=True,
             tag="broker_simple_skill",
             decode=True, rm=True,
             nocache=nocache,
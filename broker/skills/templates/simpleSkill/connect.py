@@ -8,11 +8,17 @@ For socketio, see https://python-socketio.readthedocs.io
 
 Author: Dennis Zyska
 """
+import inspect
 import logging
 import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+import msgpack
 import socketio
+from Compression import Compression
 from Skill import Skill
 
 if __name__ == '__main__':
@@ -24,41 +30,131 @@ if __name__ == '__main__':
     skill = Skill(os.environ.get('SKILL_NAME'))
     skill.init()
 
+    # dynamic batching: collect tasks up to the batch size or the wait time (seconds)
+    batch_size = int(os.environ.get('BATCH_SIZE', 1))
+    batch_wait = float(os.environ.get('BATCH_WAIT', 0.05))
+
+    # number of concurrent tasks, the broker only sends as many tasks as slots are free
+    slots = int(os.environ.get('SKILL_SLOTS', batch_size))
+    executor = ThreadPoolExecutor(max_workers=slots)
+    tasks = queue.Queue()
+
+    # compression of large payloads, the codec is selected by the broker (COMPRESSION=none to disable)
+    offered = [c for c in os.environ.get('COMPRESSION', ",".join(Compression.codecs)).split(",")
+               if c in Compression.codecs]
+    compression = {'codec': None}
+
+    # msgpack encoding of payloads (SERIALIZER=msgpack), used if the broker allows it
+    serializer = {'msgpack': False}
+
 
     @sio.on('error')
     def error(data):
         logging.error("Received error: {}".format(data))
 
 
+    def send_results(data, output, stats):
+        logging.info("Output: {}".format(output))
+        logging.info("Stats: {}".format(stats))
+
+        result = {'id': data['id'], 'data': output}
+        if compression['codec'] is not None:
+            result['data'] = compression['codec'].compress(output)
+        if serializer['msgpack']:
+            result['data'] = msgpack.packb(result['data'], use_bin_type=True)
+        if stats is not None:
+            result['stats'] = stats
+        sio.emit('taskResults', result)
+
+
+    def send_error(data, err):
+        logging.error("Error in task {}: {}".format("taskRequest", data))
+        logging.error(err)
+        sio.emit('taskResults', {'id': data['id'], 'error': {'code': 112, 'message': str(err)}})
+
+
+    def stream(data, chunks):
+        # forward the chunks of a streaming skill, the generator returns output and stats at the end
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                return stop.value
+            sio.emit('taskUpdate', {'id': data['id'], 'status': 'stream', 'data': chunk})
+
+
+    def execute(data):
+        try:
+            result = skill.execute(data['data'])
+            if inspect.isgenerator(result):
+                result = stream(data, result)
+            output, stats = result
+            send_results(data, output, stats)
+        except Exception as err:
+            send_error(data, err)
+
+
+    def execute_batches():
+        while True:
+            batch = [tasks.get()]
+            deadline = time.perf_counter() + batch_wait
+            while len(batch) < batch_size:
+                try:
+                    batch.append(tasks.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except queue.Empty:
+                    break
+
+            logging.info("Execute batch of {} tasks".format(len(batch)))
+            try:
+                for data, (output, stats) in zip(batch, skill.execute_batch([data['data'] for data in batch])):
+                    send_results(data, output, stats)
+            except Exception as err:
+                for data in batch:
+                    send_error(data, err)
+
+
+    @sio.on('compression')
+    def compression_negotiated(data):
+        logging.info("Compression: {}".format(data))
+        compression['codec'] = Compression(data['codec'], data['threshold'])
+
+
+    @sio.on('serializer')
+    def serializer_negotiated(data):
+        logging.info("Serializer: {}".format(data))
+        serializer['msgpack'] = data['serializer'] == "msgpack"
+
+
     @sio.on("taskRequest")
     def task(data):
+        if isinstance(data['data'], bytes):
+            data['data'] = msgpack.unpackb(data['data'], raw=False)
+        data['data'] = Compression.decompress(data['data'])
         logging.info("Received new task: {}".format(data))
-        try:
-            output, stats = skill.execute(data['data'])
-            logging.info("Output: {}".format(output))
-            logging.info("Stats: {}".format(stats))
-
-            result = {'id': data['id'], 'data': output}
-            if stats is not None:
-                result['stats'] = stats
-            sio.emit('taskResults', result)
-        except Exception as err:
-            logging.error("Error in task {}: {}".format("taskRequest", data))
-            logging.error(err)
-            sio.emit('taskResults', {'id': data['id'], 'error': {'code': 112, 'message': str(err)}})
+        if batch_size > 1 and not (isinstance(data['data'], dict) and data['data'].get('stream', False)):
+            tasks.put(data)
+        else:
+            executor.submit(execute, data)
 
 
     @sio.on('connect')
     def connect():
         logging.info('Connection established!')
-        sio.emit('skillRegister', skill.get_config())
+        sio.emit('skillRegister', {**skill.get_config(), 'slots': slots})
+
 
+    if batch_size > 1:
+        for _ in range(max(1, slots // batch_size)):
+            threading.Thread(target=execute_batches, daemon=True).start()
 
     logging.info("Connect to broker...")
     while True:
         try:
             logging.info("Connect to broker {}".format(os.environ.get('BROKER_URL')))
-            sio.connect(os.environ.get('BROKER_URL'))
+            auth = {'compression': offered}
+            if os.environ.get('SERIALIZER', "json") == "msgpack":
+                auth['serializer'] = "msgpack"
+            sio.connect(os.environ.get('BROKER_URL'), auth=auth)
             sio.wait()
         except Exception as e:
             logging.error(e)
@@ -1,6 +1,7 @@
 import os
 
 from Crypto.Hash import SHA256
+from eventlet import tpool
 from flask import request, session
 from flask_socketio import join_room, leave_room
 
@@ -19,9 +20,9 @@ class Auth(Socket):
         super().__init__("skill", db, socketio)
 
     def _init(self):
-        self.socketio.on_event("authRequest", self.request)
-        self.socketio.on_event("authResponse", self.response)
-        self.socketio.on_event("authStatus", self.status)
+        self.on("authRequest", self.request)
+        self.on("authResponse", self.response)
+        self.on("authStatus", self.status)
 
     def response(self, data):
         """
@@ -35,14 +36,15 @@ class Auth(Socket):
                 return
             client = self.db.clients.get(session["sid"])
             if "secret" in client:
-                if verify(client['secret'], data['sig'], data['pub']):
+                # verification runs in the thread pool of eventlet to not block other clients
+                if tpool.execute(verify, client['secret'], data['sig'], data['pub']):
                     user = self.db.users.auth(session["sid"], data['pub'])
                     user = self.db.users.get(user['_key'])
                     client['user'] = user['_key']
 
                     # updating client role
+                    leave_room("role:{}".format(client['role']))
                     client['role'] = user['role']
-                    leave_room("role:guests")
                     join_room("role:{}".format(user['role']))
 
                     # send skill updates as role changed
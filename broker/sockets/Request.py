@@ -1,7 +1,7 @@
-import numpy as np
 from flask import session
 
 from broker.sockets import Socket
+from broker.utils.JobQuota import JobQuota
 
 
 class Request(Socket):
@@ -15,10 +15,11 @@ class Request(Socket):
         super().__init__("skill", db, socketio)
 
     def _init(self):
-        self.socketio.on_event("skillRequest", self.request)
-        self.socketio.on_event("taskResults", self.results)
-        self.socketio.on_event("taskUpdate", self.results)
-        self.socketio.on_event("requestAbort", self.abort)
+        self.on("skillRequest", self.request)
+        self.on("skillRequestBatch", self.request_batch)
+        self.on("taskResults", self.results)
+        self.on("taskUpdate", self.results)
+        self.on("requestAbort", self.abort)
 
     def request(self, data):
         """
@@ -30,41 +31,124 @@ class Request(Socket):
                                    to=session["sid"])
                 return
 
+            if 'data' in data:
+                data['data'] = self.db.clients.decode(session["sid"], data['data'])
+            if not self.db.clients.accepts(session["sid"], data.get('data')):
+                self.socketio.emit("error", {"id": data['id'] if 'id' in data else None, "code": 114},
+                                   to=session["sid"])
+                return
+
+            # results of a deterministic skill are already known
+            if self.db.tasks.cached(session["sid"], data):
+                return
+
             # get a node that provides this skill
             node = self.db.skills.get_node(session["sid"], data["name"])
-            if node is None:
+            if node is None and not self.db.tasks.queueable(session["sid"], data["name"]):
                 self.socketio.emit("error", {"id": data['id'] if 'id' in data else None, "code": 200},
                                    to=session["sid"])
-            else:
-                # check if the client has enough quota to run this job
-                reserve_quota = np.random.randint(1000000, 2 ** 31 - 1)
-                if self.db.clients.quota(session["sid"], append=reserve_quota, is_job=True):
-                    self.socketio.emit("error", {"id": data['id'] if 'id' in data else None, "code": 101},
-                                       to=session["sid"])
-                    return
+                return
 
-                task_id = self.db.tasks.create(session["sid"], node, data)
+            # check if the client has enough quota to run this job
+            reserve_quota = JobQuota.reserve_id()
+            if self.db.clients.quota(session["sid"], append=reserve_quota, is_job=True):
+                self.socketio.emit("error", {"id": data['id'] if 'id' in data else None, "code": 101},
+                                   to=session["sid"])
+                return
 
-                if task_id > 0:
-                    self.socketio.emit("taskRequest", {'id': task_id, 'name': data['name'], 'data': data['data']},
-                                       room=node['sid'])
+            # an identical request is already running
+            if self.db.tasks.coalesce(session["sid"], data, reserve_quota):
+                return
 
-                self.db.clients.quotas[session["sid"]]["jobs"].update(reserve_quota, task_id)
+            if node is None:
+                # wait for a free node
+                self.db.tasks.enqueue(session["sid"], data, reserve_quota)
+            else:
+                self.db.tasks.dispatch(session["sid"], node, data, reserve_quota)
         except Exception as e:
             self.logger.error("Error in request {}: {}".format("skillRequest", data))
             self.logger.error(e)
             self.socketio.emit("error", {"code": 500}, to=session["sid"])
 
+    def request_batch(self, data):
+        """
+        Request several skills with one message
+
+        The request quota is checked once, the job quota is reserved for the whole batch
+        and the tasks are inserted in bulk. If batchResults is set, all results are sent together.
+        """
+        try:
+            if self.db.clients.quota(session["sid"], append=True):
+                self.socketio.emit("error", {"id": data['id'] if 'id' in data else None, "code": 100},
+                                   to=session["sid"])
+                return
+
+            requests = data["requests"]
+            if not isinstance(requests, list) or not all(
+                    isinstance(r, dict) and 'name' in r and 'data' in r for r in requests):
+                raise ValueError("Invalid batch request")
+            for r in requests:
+                r['data'] = self.db.clients.decode(session["sid"], r['data'])
+            if not all(self.db.clients.accepts(session["sid"], r['data']) for r in requests):
+                self.socketio.emit("error", {"id": data['id'] if 'id' in data else None, "code": 114},
+                                   to=session["sid"])
+                return
+
+            # check if the client has enough quota to run all jobs
+            reserved = [JobQuota.reserve_id() for _ in requests]
+            if self.db.clients.quotas[session["sid"]]["jobs"].reserve(reserved):
+                self.socketio.emit("error", {"id": data['id'] if 'id' in data else None, "code": 101},
+                                   to=session["sid"])
+                return
+
+            batch = None
+            if 'batchResults' in data and data['batchResults']:
+                batch = self.db.tasks.open_batch(session["sid"], data.get('id'), len(requests))
+
+            tasks = []
+            queued = []
+            for payload, reserve_quota in zip(requests, reserved):
+                if self.db.tasks.cached(session["sid"], payload, batch=batch):
+                    self.db.clients.quotas[session["sid"]]["jobs"].remove(reserve_quota)
+                    continue
+                if self.db.tasks.coalesce(session["sid"], payload, reserve_quota, batch=batch):
+                    continue
+                node = self.db.skills.get_node(session["sid"], payload["name"])
+                if node is not None:
+                    # count as outstanding, so the next request of the batch sees the load
+                    self.db.skills.routing.acquire(reserve_quota, node['sid'])
+                    tasks.append((node, payload, reserve_quota))
+                elif self.db.tasks.queueable(session["sid"], payload["name"]):
+                    queued.append((payload, reserve_quota))
+                else:
+                    self.db.clients.quotas[session["sid"]]["jobs"].remove(reserve_quota)
+                    self.db.tasks.send_error(session["sid"], payload, 200, batch=batch)
+
+            if len(tasks) > 0:
+                self.db.tasks.dispatch_many(session["sid"], tasks, batch=batch, acquired=True)
+            for payload, reserve_quota in queued:
+                self.db.tasks.enqueue(session["sid"], payload, reserve_quota, batch=batch)
+        except Exception as e:
+            self.logger.error("Error in request {}: {}".format("skillRequestBatch", data))
+            self.logger.error(e)
+            self.socketio.emit("error", {"code": 500}, to=session["sid"])
+
     def results(self, data):
         """
         Send results to client
         """
         try:
             node = session["sid"]
-            if self.db.clients.quota(node, append=True, is_result=True):
+            # a stream is counted once (with its first chunk), further chunks are relayed directly
+            if not self.db.tasks.streaming(data) and self.db.clients.quota(node, append=True, is_result=True):
                 self.socketio.emit("error", {"code": 100}, to=session["sid"])
                 return
 
+            if type(data) is dict and 'data' in data:
+                data['data'] = self.db.clients.decode(node, data['data'])
+            if type(data) is dict and not self.db.clients.accepts(node, data.get('data')):
+                self.socketio.emit("error", {"id": data.get('id'), "code": 114}, to=session["sid"])
+                return
             if type(data) is dict and "id" in data and ("error" in data or "data" in data):
                 self.db.tasks.update(data["id"], node, data)
             else:
@@ -16,27 +16,36 @@ class Skill(Socket):
         super().__init__("skill", db, socketio)
 
     def _init(self):
-        self.socketio.on_event("skillRegister", self.register)
-        self.socketio.on_event("skillGetAll", self.get_all)
-        self.socketio.on_event("skillGetConfig", self.get_config)
+        self.on("skillRegister", self.register, limited=False)
+        self.on("skillGetAll", self.get_all)
+        self.on("skillGetConfig", self.get_config)
 
     def get_config(self, data):
         """
         Get configuration from a skill by name
+
+        If the client sends the hash of its cached config and the config is unchanged,
+        only {name, hash, modified: false} is sent instead of the config.
         """
         try:
             if self.db.clients.quota(session["sid"], append=True):
                 self.socketio.emit("error", {"code": 100}, to=session["sid"])
                 return
 
-            client = self.db.clients.get(session["sid"])
-            skills = self.db.skills.get_skills(filter_role=client["role"], filter_name=data["name"], with_config=True)
+            skill = self.db.skills.catalog.get(data["name"], role=self.db.clients.get_role(session["sid"]),
+                                               with_config=True)
 
-            if len(skills) == 0:
+            if skill is None:
                 self.socketio.emit("error", {"code": 203}, to=session["sid"])
                 return
 
-            self.socketio.emit("skillConfig", skills[0]['config'], to=session["sid"])
+            if data.get("hash") == skill['hash']:
+                self.socketio.emit("skillConfig", (None, {"name": data["name"], "hash": skill['hash'], "modified": False}),
+                                   to=session["sid"])
+                return
+
+            self.socketio.emit("skillConfig", (skill['config'], {"name": data["name"], "hash": skill['hash'],
+                                                                 "modified": True}), to=session["sid"])
         except Exception as e:
             self.logger.error("Error in request {}: {}".format("skillGetConfig", data))
             self.logger.error(e)
@@ -54,9 +63,7 @@ class Skill(Socket):
                 self.socketio.emit("error", {"code": 100}, to=session["sid"])
                 return
 
-            client = self.db.clients.get(session["sid"])
-
-            self.db.skills.send_all(role=client['role'], to=session["sid"])
+            self.db.skills.send_all(role=self.db.clients.get_role(session["sid"]), to=session["sid"])
         except Exception as e:
             self.logger.error("Error in request {}".format("skillGetAll"))
             self.logger.error(e)
@@ -1,3 +1,6 @@
+from flask import request
+from flask_socketio import disconnect
+
 from broker import init_logging
 
 
@@ -21,3 +24,23 @@ class Socket:
         :return: True if successful, False otherwise
         """
         pass
+
+    def on(self, event, handler, limited=True):
+        """
+        Register an event handler (events are rate-limited per ip address before the handler is called)
+        :param event: name of the event
+        :param handler: event handler
+        :param limited: apply the event rate limit (e.g., not for the registration of skill nodes)
+        """
+        if not limited:
+            self.socketio.on_event(event, handler)
+            return
+
+        def rate_limited_handler(*args):
+            if not self.db.clients.allow(request.sid, request.remote_addr):
+                self.socketio.emit("error", {"code": 113}, to=request.sid)
+                disconnect()
+                return
+            return handler(*args)
+
+        self.socketio.on_event(event, rate_limited_handler)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class Admission:
+    """
+    Admission of new connections (rate limit for reconnect storms)
+
+    Connection setups are scheduled with a generic cell rate algorithm: up to burst connections are
+    set up directly, further connections wait for their slot (in order of arrival) so that at most
+    rate connections per second reach the database. If more than max_queue connections are waiting,
+    new connections are rejected (clients reconnect later). The broker is in storm mode while
+    connections are waiting and for window seconds afterwards.
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self, rate=200, burst=400, max_queue=10000, window=5):
+        self.interval = 1 / rate
+        self.tolerance = burst * self.interval
+        self.max_queue = max_queue
+        self.window = window
+
+        self.tat = 0  # theoretical arrival time of the next connection
+        self.waiting = 0
+        self.last_wait = None
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0}
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait for the slot of a new connection
+        :return: True if the connection can be set up, False if it is rejected
+        """
+        with self.lock:
+            now = time.monotonic()
+            tat = max(self.tat, now)
+            delay = tat - self.tolerance - now
+            if delay > 0:
+                if self.waiting >= self.max_queue:
+                    self.stats['rejected'] += 1
+                    return False
+                self.waiting += 1
+                self.last_wait = now
+                self.stats['queued'] += 1
+            self.tat = tat + self.interval
+            self.stats['admitted'] += 1
+
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+        return True
+
+    def storm(self):
+        """
+        Check if the broker is in storm mode (connections had to wait recently)
+        :return: True if in storm mode
+        """
+        return self.last_wait is not None and (self.waiting > 0 or time.monotonic() - self.last_wait < self.window)
+
+    def get_stats(self):
+        """
+        Statistics of the admission
+        :return: dict with admitted, queued, rejected and waiting connections
+        """
+        with self.lock:
+            return {**self.stats, "waiting": self.waiting, "storm": self.storm()}
@@ -0,0 +1,120 @@
+import base64
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Compression:
+    """
+    Compression of large payloads (negotiated per connection)
+
+    A compressed payload is replaced by an envelope {compression, size, data} with the base64 encoded
+    compressed json, so it can be stored in the database and passed through without decompressing.
+    zstd is only available if the zstandard package is installed.
+
+    @author: Dennis Zyska
+    """
+    codecs = ["zstd", "zlib"] if zstandard is not None else ["zlib"]
+
+    def __init__(self, codec="zlib", threshold=16384):
+        self.codec = codec
+        self.threshold = threshold
+
+    @classmethod
+    def negotiate(cls, offered, allowed=None):
+        """
+        Select the codec of a connection
+        :param offered: list of codecs supported by the client (in order of preference)
+        :param allowed: list of codecs allowed by the broker (default all available)
+        :return: codec or None
+        """
+        if not isinstance(offered, list):
+            return None
+        allowed = cls.codecs if allowed is None else [c for c in allowed if c in cls.codecs]
+        return next((c for c in offered if c in allowed), None)
+
+    @staticmethod
+    def is_compressed(data):
+        """
+        Check if data is a compressed envelope
+        :param data: payload
+        :return: True if compressed
+        """
+        return isinstance(data, dict) and len(data) == 3 and 'compression' in data and 'size' in data and 'data' in data
+
+    def compress(self, data):
+        """
+        Compress data if the json is larger than the threshold
+        :param data: payload
+        :return: envelope or data
+        """
+        if self.is_compressed(data):
+            return data
+        raw = json.dumps(data, separators=(',', ':')).encode("utf-8")
+        if len(raw) < self.threshold:
+            return data
+        if self.codec == "zstd":
+            compressed = zstandard.ZstdCompressor().compress(raw)
+        else:
+            compressed = zlib.compress(raw)
+        return {'compression': self.codec, 'size': len(raw), 'data': base64.b64encode(compressed).decode("ascii")}
+
+    @staticmethod
+    def decompress(data, max_size=None):
+        """
+        Decompress an envelope (the output is bounded by the size of the envelope)
+        :param data: payload
+        :param max_size: maximum size of the decompressed payload in bytes (None for no limit)
+        :return: original data (data itself if not compressed)
+        """
+        if not Compression.is_compressed(data):
+            return data
+        if not Compression.valid_size(data['size'], max_size):
+            raise ValueError("Invalid size of compressed payload")
+        size = data['size']
+        compressed = base64.b64decode(data['data'])
+        if data['compression'] == "zstd":
+            if zstandard is None:
+                raise ValueError("zstd compression is not available")
+            # max_output_size is ignored if the frame contains a content size, the reader is always bounded
+            with zstandard.ZstdDecompressor().stream_reader(compressed) as reader:
+                raw = reader.read(size + 1)
+        elif data['compression'] == "zlib":
+            raw = zlib.decompressobj().decompress(compressed, size + 1)
+        else:
+            raise ValueError("Unknown compression {}".format(data['compression']))
+        if len(raw) != size:
+            raise ValueError("Compressed payload does not match its size")
+        return json.loads(raw)
+
+    @staticmethod
+    def valid_size(size, max_size=None):
+        """
+        Check the size of an envelope (payloads below the threshold are never compressed, so it is positive)
+        :param size: size of the decompressed payload in bytes
+        :param max_size: maximum size in bytes (None for no limit)
+        :return: True if valid
+        """
+        return isinstance(size, int) and not isinstance(size, bool) and size > 0 \
+            and (max_size is None or size <= max_size)
+
+    @staticmethod
+    def encode(data, compression=None, max_size=None):
+        """
+        Prepare data for a connection (compressed payloads are passed through if the codec matches)
+        :param data: payload
+        :param compression: Compression of the receiving connection or None
+        :param max_size: maximum size of a decompressed payload in bytes (None for no limit)
+        :return: payload for the connection
+        """
+        if Compression.is_compressed(data):
+            if compression is not None and data['compression'] == compression.codec:
+                return data
+            data = Compression.decompress(data, max_size)
+        if compression is not None:
+            return compression.compress(data)
+        return data
@@ -0,0 +1,60 @@
+import heapq
+import threading
+import time
+
+
+class Deadlines:
+    """
+    Deadlines of running tasks (min-heap)
+
+    Adding a deadline costs O(log n), removed deadlines are skipped lazily when they expire,
+    so expired deadlines are found without scanning all tasks.
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self):
+        self.heap = []  # (deadline, key)
+        self.deadlines = {}  # key -> deadline
+        self.lock = threading.Lock()
+
+    def add(self, key, seconds):
+        """
+        Add a deadline
+        :param key: task key
+        :param seconds: time from now in seconds
+        """
+        deadline = time.monotonic() + seconds
+        with self.lock:
+            self.deadlines[str(key)] = deadline
+            heapq.heappush(self.heap, (deadline, str(key)))
+
+    def remove(self, key):
+        """
+        Remove a deadline (task is done), can be called multiple times
+        :param key: task key
+        """
+        with self.lock:
+            self.deadlines.pop(str(key), None)
+            # drop removed deadlines from the heap if they are the majority
+            if len(self.heap) > 64 and len(self.heap) > 2 * len(self.deadlines):
+                self.heap = [(d, k) for d, k in self.heap if self.deadlines.get(k) == d]
+                heapq.heapify(self.heap)
+
+    def expired(self):
+        """
+        Remove all expired deadlines
+        :return: list of task keys
+        """
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, key = heapq.heappop(self.heap)
+                if self.deadlines.get(key) == deadline:
+                    del self.deadlines[key]
+                    expired.append(key)
+        return expired
+
+    def __len__(self):
+        return len(self.deadlines)
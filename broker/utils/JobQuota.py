@@ -1,31 +1,49 @@
-import numpy as np
+import uuid
 
-from broker.utils.Quota import Quota
 
-
-class JobQuota(Quota):
+class JobQuota:
     """
     Job quota for a specific client
 
+    The running jobs of a client are kept in a set (at most max_len ids), so all operations are O(1).
+    Before a task is created, the quota is reserved with a unique id (see reserve_id) that is
+    replaced by the task key later.
+
     @author: Dennis Zyska
     """
+    __slots__ = ("max_len", "jobs")
+
+    def __init__(self, max_len=0, jobs=None):
+        self.max_len = max_len
+        self.jobs = set(jobs) if jobs is not None else set()
+
+    @classmethod
+    def reserve_id(cls):
+        """
+        Unique id to reserve the quota of a job before the task is created
+        (globally unique, the jobs of a user can be shared by several broker processes in redis)
+        :return: id
+        """
+        return "reserved/{}".format(uuid.uuid4().hex)
 
     def __call__(self, append=None):
         """
         Check if the quota is exceeded for a specific sid
 
-        :param append: set job key to queue if quota is not exceeded
+        :param append: add job id if quota is not exceeded
         :return:
         """
-        if self.queue is None:
+        if self.max_len <= 0:
             return False
 
         if self.exceed():
             return True
-        else:
-            if append:
-                self.queue[(self.queue == 0).argmax(axis=0)] = int(append)
-            return False
+        if append:
+            self.jobs.add(str(append))
+        return False
+
+    def __len__(self):
+        return len(self.jobs)
 
     def exceed(self):
         """
@@ -33,10 +51,22 @@ class JobQuota(Quota):
 
         :return: True if quota is exceeded
         """
-        if (self.queue == 0).any():
+        return self.max_len > 0 and len(self.jobs) >= self.max_len
+
+    def reserve(self, reserved_ids):
+        """
+        Reserve the quota for several jobs at once (all or nothing)
+
+        :param reserved_ids: list of reserved ids
+        :return: True if quota is exceeded
+        """
+        if self.max_len <= 0:
             return False
-        else:
+
+        if len(self.jobs) + len(reserved_ids) > self.max_len:
             return True
+        self.jobs.update(str(r) for r in reserved_ids)
+        return False
 
     def remove(self, task_id):
         """
@@ -44,30 +74,32 @@ class JobQuota(Quota):
 
         :param task_id: task id
         """
-        if self.queue is not None:
-            self.queue[self.queue == int(task_id)] = 0
+        self.jobs.discard(str(task_id))
 
     def append(self, task_id):
         """
-        Append a job to the quota
+        Append a job to the quota (e.g., a task is restarted)
         :param task_id:
         :return:
         """
-        if self.queue is not None:
-            self.queue[(self.queue != 0).argmax(axis=0)] = task_id
+        if self.max_len > 0:
+            self.jobs.add(str(task_id))
 
     def update(self, reserved_id, task_id):
         """
-        Update the quota with a reserved id
+        Update the quota with a reserved id (the reservation is dropped if no task was created, e.g. simulated)
         :param reserved_id:
         :param task_id:
         :return:
         """
-        if self.queue is not None:
-            self.queue[(self.queue == reserved_id).argmax(axis=0)] = task_id
+        if not task_id:
+            self.remove(reserved_id)
+        elif str(reserved_id) in self.jobs:
+            self.jobs.remove(str(reserved_id))
+            self.jobs.add(str(task_id))
 
     def reset(self):
         """
         Reset the quota
         """
-        self.queue = np.zeros(self.max_len, dtype=int)
+        self.jobs = set()
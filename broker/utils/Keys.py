@@ -1,16 +1,23 @@
+import hashlib
+from functools import lru_cache
+
 from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
+from Crypto.PublicKey import ECC, RSA
+from Crypto.Signature import PKCS1_v1_5, eddsa
 
 
 def read_private(path="private.pem"):
     """
-    Read private key from file
+    Read private key from file (RSA or Ed25519)
     :param path: path to file
     :return: private key
     """
     with open(path, "r") as src:
-        return RSA.importKey(src.read())
+        key = src.read()
+    try:
+        return RSA.importKey(key)
+    except ValueError:
+        return ECC.import_key(key)
 
 
 def write_pub(key, path="public_key.txt"):
@@ -24,18 +31,46 @@ def write_pub(key, path="public_key.txt"):
         out.write(key.exportKey().decode('utf-8'))
 
 
+@lru_cache(maxsize=4096)
+def import_public(key):
+    """
+    Parse a public key (cached, clients authenticate with the same key again after reconnecting)
+    :param key: public key (hex encoded DER, RSA or Ed25519)
+    :return: public key object
+    """
+    try:
+        return RSA.importKey(bytes.fromhex(key))
+    except ValueError:
+        return ECC.import_key(bytes.fromhex(key))
+
+
+def fingerprint(key):
+    """
+    Fingerprint of a public key (used to find users by their key)
+    :param key: public key (hex encoded DER)
+    :return: sha256 hex digest
+    """
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
 def verify(message, sig, key):
     """
     verify signature from message with public key
     :param message: message to verify
     :param sig: signature to verify
-    :param key: public key
+    :param key: public key (RSA with PKCS#1 v1.5 and SHA256, or Ed25519)
     :return:
     """
-    hash = SHA256.new(message.encode('utf-8'))
-    pubkey = RSA.importKey(bytes.fromhex(key))
-    verifier = PKCS1_v1_5.new(pubkey)
-    return verifier.verify(hash, bytes.fromhex(sig))
+    try:
+        pubkey = import_public(key)
+        if isinstance(pubkey, ECC.EccKey):
+            eddsa.new(pubkey, 'rfc8032').verify(message.encode('utf-8'), bytes.fromhex(sig))
+            return True
+        hash = SHA256.new(message.encode('utf-8'))
+        verifier = PKCS1_v1_5.new(pubkey)
+        return verifier.verify(hash, bytes.fromhex(sig))
+    except ValueError:
+        return False
 
 
 class Keys:
@@ -45,13 +80,20 @@ class Keys:
     @author: Dennis Zyska
     """
 
-    def __init__(self, private_key_path=None):
+    def __init__(self, private_key_path=None, key_type="rsa"):
+        """
+        :param private_key_path: path to the private key, a new key is generated if None
+        :param key_type: type of a new key (rsa or ed25519, verification of ed25519 is much cheaper)
+        """
         if private_key_path is None:
             # Generate new key
-            self.private_key = RSA.generate(2048)
+            if key_type == "ed25519":
+                self.private_key = ECC.generate(curve="ed25519")
+            else:
+                self.private_key = RSA.generate(2048)
         else:
             self.private_key = read_private(private_key_path)
-        self.public_key = self.private_key.publickey()
+        self.public_key = self.private_key.public_key()
 
     def sign(self, message):
         """
@@ -59,6 +101,8 @@ class Keys:
         :param message: message to sign
         :return: signature
         """
+        if isinstance(self.private_key, ECC.EccKey):
+            return eddsa.new(self.private_key, 'rfc8032').sign(message.encode('utf-8')).hex()
         digest = SHA256.new()
         digest.update(message.encode('utf-8'))
         signer = PKCS1_v1_5.new(self.private_key)
@@ -70,4 +114,6 @@ class Keys:
         Return public key
         :return:
         """
+        if isinstance(self.public_key, ECC.EccKey):
+            return self.public_key.export_key(format="DER").hex()
         return self.public_key.exportKey("DER").hex()
@@ -1,39 +1,43 @@
 import time
-from collections import deque
-import numpy as np
 
 
 class Quota:
     """
     This class is used to limit the number of requests per second for a specific client.
 
+    The quota allows max_len requests at once, afterwards one request every interval / max_len seconds
+    (generic cell rate algorithm with a tolerance of interval - increment), so a client only needs
+    a single timestamp instead of a queue of timestamps. Unlike the previous sliding window, a client can send
+    up to 2 * max_len - 1 requests within one interval (a full burst followed by the refill).
+
     @author: Dennis Zyska
     """
+    __slots__ = ("max_len", "interval", "increment", "tolerance", "tat")
 
     def __init__(self, max_len=100, interval=1):
         self.max_len = max_len
-        self.queue = None
         self.interval = interval
-
-        if max_len > 0:
-            self.reset()
+        self.increment = interval / max_len if max_len > 0 else 0
+        self.tolerance = interval - self.increment  # burst of max_len requests
+        self.tat = 0.0  # theoretical arrival time of the next request
 
     def __call__(self, append=True):
         """
         Check if the quota is exceeded for a specific sid
 
-        :param append: add current time to queue if quota is not exceeded
+        :param append: count the request if quota is not exceeded
         :return:
         """
-        if self.queue is None:
+        if self.max_len <= 0:
             return False
 
-        if self.exceed():
+        now = time.monotonic()
+        tat = self.tat if self.tat > now else now
+        if tat - now > self.tolerance + 1e-9:
             return True
-        else:
-            if append:
-                self.queue.append(time.perf_counter())
-            return False
+        if append:
+            self.tat = tat + self.increment
+        return False
 
     def exceed(self):
         """
@@ -41,16 +45,10 @@ class Quota:
 
         :return: True if quota is exceeded
         """
-        if len(self.queue) >= self.max_len:
-            elapsed_time = time.perf_counter() - self.queue[0]
-            if elapsed_time >= self.interval:
-                self.queue.popleft()
-                return False
-            else:
-                return True
+        return self(append=False)
 
     def reset(self):
         """
         Reset the quota
         """
-        self.queue = deque(maxlen=self.max_len)
+        self.tat = 0.0
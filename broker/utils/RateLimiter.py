@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket per key (e.g., ip address or session id) without database access
+
+    The bucket of a key is stored as a single float (theoretical arrival time of the generic cell rate algorithm),
+    a key with an expired time is the same as a full bucket and is dropped if the table gets too large.
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self, rate=10, burst=50, max_keys=100000):
+        self.interval = 1 / rate
+        self.tolerance = burst * self.interval
+        self.max_keys = max_keys
+        self.tats = {}  # key -> theoretical arrival time
+        self.allowed = 0
+        self.shed = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, key):
+        """
+        Take a token from the bucket of a key
+        :param key: key, e.g. ip address
+        :return: True if allowed, False if the rate is exceeded
+        """
+        now = time.monotonic()
+        with self.lock:
+            tat = max(self.tats.get(key, now), now) + self.interval
+            if tat - now > self.tolerance:
+                self.shed += 1
+                return False
+            self.tats[key] = tat
+            self.allowed += 1
+            if len(self.tats) > self.max_keys:
+                self.tats = {k: t for k, t in self.tats.items() if t > now}
+            return True
+
+    def discard(self, key):
+        """
+        Remove the bucket of a key (e.g., the connection is closed)
+        :param key: key
+        """
+        with self.lock:
+            self.tats.pop(key, None)
+
+    def get_stats(self):
+        """
+        Statistics of the rate limiter
+        :return: dict with allowed, shed and tracked keys
+        """
+        return {"allowed": self.allowed, "shed": self.shed, "keys": len(self.tats)}
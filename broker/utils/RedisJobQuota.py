@@ -0,0 +1,125 @@
+class RedisJobQuota:
+    """
+    Job quota of a client stored in redis (running jobs are shared by all broker processes)
+
+    The running jobs are a redis set, checks and changes are lua scripts or pipelines (one round trip).
+    The set expires after ttl seconds without changes (e.g., a broker process was killed).
+
+    @author: Dennis Zyska
+    """
+    __slots__ = ("redis", "key", "max_len", "ttl", "scripts")
+
+    # KEYS[1]: set of running jobs, ARGV: max_len, ttl, job ids to add (all or nothing)
+    add_script = """
+        if redis.call('SCARD', KEYS[1]) + #ARGV - 2 > tonumber(ARGV[1]) then
+            return 1
+        end
+        if #ARGV > 2 then
+            redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+            redis.call('EXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+    # KEYS[1]: set of running jobs, ARGV: max_len, ttl (check without adding a job)
+    check_script = """
+        if redis.call('SCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+            return 1
+        end
+        return 0
+    """
+    # KEYS[1]: set of running jobs, ARGV: reserved id, task id, ttl
+    update_script = """
+        if redis.call('SREM', KEYS[1], ARGV[1]) == 1 then
+            redis.call('SADD', KEYS[1], ARGV[2])
+            redis.call('EXPIRE', KEYS[1], ARGV[3])
+        end
+        return 0
+    """
+
+    def __init__(self, redis, key, max_len=0, jobs=None, ttl=86400):
+        self.redis = redis
+        self.key = key
+        self.max_len = max_len
+        self.ttl = ttl
+        self.scripts = {name: redis.register_script(getattr(self, name + "_script")) for name in ["add", "check", "update"]}
+        if max_len > 0 and jobs:
+            self.append(*jobs)
+
+    @property
+    def jobs(self):
+        """
+        Running jobs
+        :return: set of job ids
+        """
+        return {j.decode("utf-8") if isinstance(j, bytes) else j for j in self.redis.smembers(self.key)}
+
+    def __call__(self, append=None):
+        """
+        Check if the quota is exceeded for a specific client
+
+        :param append: add job id if quota is not exceeded
+        :return:
+        """
+        if self.max_len <= 0:
+            return False
+        if append:
+            return self.scripts['add'](keys=[self.key], args=[self.max_len, self.ttl, str(append)]) == 1
+        return self.scripts['check'](keys=[self.key], args=[self.max_len, self.ttl]) == 1
+
+    def __len__(self):
+        return self.redis.scard(self.key)
+
+    def exceed(self):
+        """
+        Check if the quota is exceeded for a specific client
+
+        :return: True if quota is exceeded
+        """
+        return self(append=None)
+
+    def reserve(self, reserved_ids):
+        """
+        Reserve the quota for several jobs at once (all or nothing)
+
+        :param reserved_ids: list of reserved ids
+        :return: True if quota is exceeded
+        """
+        if self.max_len <= 0:
+            return False
+        return self.scripts['add'](keys=[self.key], args=[self.max_len, self.ttl] + [str(r) for r in reserved_ids]) == 1
+
+    def remove(self, task_id):
+        """
+        Remove a job from the quota
+
+        :param task_id: task id
+        """
+        self.redis.srem(self.key, str(task_id))
+
+    def append(self, *task_ids):
+        """
+        Append jobs to the quota (e.g., a task is restarted)
+        :param task_ids: task ids
+        """
+        if self.max_len > 0:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sadd(self.key, *[str(t) for t in task_ids])
+            pipe.expire(self.key, self.ttl)
+            pipe.execute()
+
+    def update(self, reserved_id, task_id):
+        """
+        Update the quota with a reserved id (the reservation is dropped if no task was created, e.g. simulated)
+        :param reserved_id:
+        :param task_id:
+        """
+        if not task_id:
+            self.remove(reserved_id)
+            return
+        self.scripts['update'](keys=[self.key], args=[str(reserved_id), str(task_id), self.ttl])
+
+    def reset(self):
+        """
+        Reset the quota
+        """
+        self.redis.delete(self.key)
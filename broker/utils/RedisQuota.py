@@ -0,0 +1,62 @@
+class RedisQuota:
+    """
+    Request quota of a client stored in redis (shared by all broker processes)
+
+    Same behaviour as Quota (generic cell rate algorithm), the check and update is a single lua script,
+    so each request needs one round trip. The time of the redis server is used for all processes.
+
+    @author: Dennis Zyska
+    """
+    __slots__ = ("redis", "key", "max_len", "interval", "script")
+
+    # KEYS[1]: quota key, ARGV: increment (us), tolerance (us), append (0/1)
+    gcra_script = """
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+        local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+        if tat < now then
+            tat = now
+        end
+        if tat - now > tonumber(ARGV[2]) then
+            return 1
+        end
+        tat = tat + tonumber(ARGV[1])
+        if ARGV[3] == '1' then
+            redis.call('SET', KEYS[1], string.format('%.0f', tat), 'PX', math.ceil((tat - now) / 1000) + 1)
+        end
+        return 0
+    """
+
+    def __init__(self, redis, key, max_len=100, interval=1):
+        self.redis = redis
+        self.key = key
+        self.max_len = max_len
+        self.interval = interval
+        self.script = redis.register_script(self.gcra_script)
+
+    def __call__(self, append=True):
+        """
+        Check if the quota is exceeded for a specific client
+
+        :param append: count the request if quota is not exceeded
+        :return:
+        """
+        if self.max_len <= 0:
+            return False
+        increment = int(self.interval * 1000000 / self.max_len)
+        tolerance = int(self.interval * 1000000) - increment
+        return self.script(keys=[self.key], args=[increment, tolerance, 1 if append else 0]) == 1
+
+    def exceed(self):
+        """
+        Check if the quota is exceeded for a specific client
+
+        :return: True if quota is exceeded
+        """
+        return self(append=False)
+
+    def reset(self):
+        """
+        Reset the quota
+        """
+        self.redis.delete(self.key)
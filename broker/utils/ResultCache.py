@@ -0,0 +1,105 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Content-addressed cache for the results of deterministic skills
+
+    The key is a hash of the skill name, the normalized request data and the shared skill config
+    (e.g., a new model version gets new keys). Entries expire after the TTL of the skill,
+    the least recently used entries are evicted if the total size exceeds max_bytes.
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600, skills=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.skills = skills if skills is not None else {}  # skill name -> ttl
+        self.entries = OrderedDict()  # key -> (expires, size, value)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def enabled(config, payload):
+        """
+        Check if the results of a request can be cached
+        :param config: skill config
+        :param payload: request payload
+        :return: True if the request or the skill enables the cache
+        """
+        request_config = payload.get('config', {})
+        if 'simulate' in request_config:
+            return False
+        if 'cache' in request_config:
+            return bool(request_config['cache'])
+        return bool(config.get('cacheable', False))
+
+    @staticmethod
+    def key(name, data, config):
+        """
+        Cache key of a request
+        :param name: skill name
+        :param data: request data
+        :param config: shared skill config
+        :return: key or None if the data can not be normalized
+        """
+        try:
+            normalized = json.dumps([name, data, config], sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Get a cached result
+        :param key: cache key
+        :return: cached value or None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, name, value):
+        """
+        Add a result to the cache
+        :param key: cache key
+        :param name: skill name (for the ttl)
+        :param value: result (must be json serializable)
+        """
+        ttl = self.skills.get(name, self.ttl)
+        size = len(json.dumps(value, separators=(',', ':')))
+        if ttl <= 0 or size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + ttl, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def get_stats(self):
+        """
+        Statistics of the cache
+        :return: dict
+        """
+        return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
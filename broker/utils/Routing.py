@@ -0,0 +1,210 @@
+from broker.utils.Selection import strategies
+
+
+class Routing:
+    """
+    In-memory routing table of all connected skill nodes
+
+    The nodes are kept per skill name and role, so selecting a node for a request never touches the database.
+    Nodes without roles (or an empty list of roles) are public and available for every role,
+    the admin role can access all nodes of a skill.
+    The selection strategy can be configured per skill (see Selection), therefore the table also
+    keeps track of the outstanding tasks per node. A node can announce its number of concurrent slots
+    in its skill config (credit-based flow control), otherwise nodes with maxNodeTasks outstanding tasks
+    are busy if the pending queue is enabled. Busy nodes are not selected.
+
+    @author: Dennis Zyska
+    """
+    ALL = "*"
+    PUBLIC = None
+
+    def __init__(self, config=None):
+        self.config = config['routing'] if config is not None and 'routing' in config else {}
+        self.nodes = {}  # sid -> list of registered skills
+        self.skills = {}  # skill key -> skill document
+        self.routes = {}  # skill name -> role -> list of skills
+        self.positions = {}  # (skill name, role, skill key) -> position in route list
+        self.strategies = {}  # skill name -> selection strategy
+        self.outstanding = {}  # sid -> number of outstanding tasks
+        self.tasks = {}  # task key -> sid
+        self.credits = 0  # number of registered skills with slots
+
+        queue = config['queue'] if config is not None and 'queue' in config else {}
+        self.limit = queue.get('maxNodeTasks', 0) if queue.get('enabled', False) else 0
+
+    def add(self, skill):
+        """
+        Add a registered skill to the routing table
+
+        :param skill: skill document (with _key, sid and config)
+        """
+        self.nodes.setdefault(skill['sid'], []).append(skill)
+        self.skills[skill['_key']] = skill
+        if 'slots' in skill['config']:
+            self.credits += 1
+        for role in self._roles(skill):
+            self._push(skill['config']['name'], role, skill)
+
+    def remove(self, sid):
+        """
+        Remove all skills of a node from the routing table
+
+        :param sid: session id of skill node
+        :return: list of removed skills
+        """
+        skills = self.nodes.pop(sid, [])
+        for skill in skills:
+            self.skills.pop(skill['_key'], None)
+            for role in self._roles(skill):
+                self._pop(skill['config']['name'], role, skill)
+            if 'slots' in skill['config']:
+                self.credits -= 1
+            self.strategy(skill['config']['name']).remove(skill)
+        # tasks of the node are not reported anymore (e.g., aborted tasks that were never killed)
+        self.outstanding.pop(sid, None)
+        return skills
+
+    def get(self, name, role):
+        """
+        Get a node by skill name for a role (selected by the strategy of the skill)
+
+        :param name: skill name
+        :param role: role of the requesting client
+        :return: skill document of the node or None (no free node)
+        """
+        candidates = self.candidates(name, role)
+        if self.limit > 0 or self.credits > 0:
+            candidates = [[s for s in c if self.available(s)] for c in candidates]
+        return self.strategy(name).select(candidates)
+
+    def skill(self, key):
+        """
+        Get a connected skill by key
+        :param key: skill key
+        :return: skill document or None if the node is not connected
+        """
+        return self.skills.get(key)
+
+    def available(self, skill):
+        """
+        Check if a node has a free slot
+        :param skill: skill document
+        :return: True if the node can get another task
+        """
+        limit = int(skill['config'].get('slots', self.limit))
+        return limit <= 0 or self.outstanding.get(skill['sid'], 0) < limit
+
+    def has_nodes(self, name, role):
+        """
+        Check if there are nodes for a skill name and role (busy or not)
+        :param name: skill name
+        :param role: role of the requesting client
+        :return: True if at least one node is registered
+        """
+        return any(len(c) > 0 for c in self.candidates(name, role))
+
+    def skill_config(self, name, role):
+        """
+        Get the config of a skill (all nodes of a skill share the same config)
+        :param name: skill name
+        :param role: role of the requesting client
+        :return: skill config or None if there is no node for the role
+        """
+        for c in self.candidates(name, role):
+            if len(c) > 0:
+                return c[0]['config']
+
+    def strategy(self, name):
+        """
+        Get the selection strategy for a skill
+        :param name: skill name
+        :return: Selection instance
+        """
+        if name not in self.strategies:
+            strategy = self.config.get('skills', {}).get(name, self.config.get('default', 'random'))
+            self.strategies[name] = strategies[strategy](self)
+        return self.strategies[name]
+
+    def acquire(self, key, sid):
+        """
+        A task was sent to a node
+        :param key: task key
+        :param sid: session id of the node
+        """
+        self.tasks[str(key)] = sid
+        self.outstanding[sid] = self.outstanding.get(sid, 0) + 1
+
+    def rekey(self, old_key, new_key):
+        """
+        Assign an outstanding task to a new key (e.g., reserved before the task is created)
+        :param old_key: previous key
+        :param new_key: task key
+        """
+        sid = self.tasks.pop(str(old_key), None)
+        if sid is not None:
+            self.tasks[str(new_key)] = sid
+
+    def release(self, key):
+        """
+        A task is finished (or aborted), can be called multiple times
+        :param key: task key
+        """
+        sid = self.tasks.pop(str(key), None)
+        if sid is not None and sid in self.outstanding:
+            self.outstanding[sid] -= 1
+            if self.outstanding[sid] <= 0:
+                del self.outstanding[sid]
+
+    def candidates(self, name, role):
+        """
+        Get the lists of nodes that can be used for a skill name and role
+
+        :param name: skill name
+        :param role: role of the requesting client
+        :return: list of node lists
+        """
+        routes = self.routes.get(name, {})
+        if role == "admin":
+            return [routes.get(self.ALL, [])]
+        return [routes.get(self.PUBLIC, []), routes.get(role, [])]
+
+    def count(self, name):
+        """
+        Number of nodes currently connected for a skill
+
+        :param name: skill name
+        :return: number of nodes
+        """
+        return len(self.routes.get(name, {}).get(self.ALL, []))
+
+    def _roles(self, skill):
+        """
+        Routing keys for a skill
+        :param skill: skill document
+        :return: list of routing keys
+        """
+        if 'roles' in skill['config'] and len(skill['config']['roles']) > 0:
+            return [self.ALL] + list(skill['config']['roles'])
+        return [self.ALL, self.PUBLIC]
+
+    def _push(self, name, role, skill):
+        route = self.routes.setdefault(name, {}).setdefault(role, [])
+        self.positions[(name, role, skill['_key'])] = len(route)
+        route.append(skill)
+
+    def _pop(self, name, role, skill):
+        position = self.positions.pop((name, role, skill['_key']), None)
+        if position is None:
+            return
+        route = self.routes[name][role]
+
+        # swap with the last entry to remove in O(1)
+        last = route.pop()
+        if position < len(route):
+            route[position] = last
+            self.positions[(name, role, last['_key'])] = position
+
+        if len(route) == 0:
+            del self.routes[name][role]
+            if len(self.routes[name]) == 0:
+                del self.routes[name]
@@ -0,0 +1,134 @@
+import random
+
+
+class Selection:
+    """
+    Base class of the strategies to select a node for a task
+
+    The routing table keeps track of the outstanding tasks per node,
+    the capacity weight is advertised by the node in its skill config (default 1).
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self, routing):
+        self.routing = routing
+
+    def select(self, candidates):
+        """
+        Select a node
+        :param candidates: list of node lists (see Routing.candidates)
+        :return: skill document of the node or None
+        """
+        raise NotImplementedError
+
+    def remove(self, skill):
+        """
+        Node was removed from the routing table
+        :param skill: skill document
+        """
+        pass
+
+    def outstanding(self, skill):
+        return self.routing.outstanding.get(skill['sid'], 0)
+
+    @staticmethod
+    def weight(skill):
+        return max(float(skill['config'].get('capacity', 1)), 1e-6)
+
+    @staticmethod
+    def pick(candidates, index):
+        """
+        Get node by index over all candidate lists
+        """
+        for c in candidates:
+            if index < len(c):
+                return c[index]
+            index -= len(c)
+
+
+class RandomSelection(Selection):
+    """
+    Random node (default)
+    """
+
+    def select(self, candidates):
+        total = sum(len(c) for c in candidates)
+        if total == 0:
+            return None
+        return self.pick(candidates, random.randrange(total))
+
+
+class LeastOutstandingSelection(Selection):
+    """
+    Node with the fewest outstanding tasks relative to its capacity (ties are broken randomly)
+    """
+
+    def select(self, candidates):
+        best = None
+        best_load = None
+        ties = 0
+        for c in candidates:
+            for skill in c:
+                load = self.outstanding(skill) / self.weight(skill)
+                if best is None or load < best_load:
+                    best, best_load, ties = skill, load, 1
+                elif load == best_load:
+                    ties += 1
+                    if random.randrange(ties) == 0:
+                        best = skill
+        return best
+
+
+class PowerOfTwoSelection(Selection):
+    """
+    Power of two choices: sample two random nodes and take the one with fewer outstanding tasks
+    """
+
+    def select(self, candidates):
+        total = sum(len(c) for c in candidates)
+        if total == 0:
+            return None
+        if total == 1:
+            return self.pick(candidates, 0)
+
+        first, second = random.sample(range(total), 2)
+        first, second = self.pick(candidates, first), self.pick(candidates, second)
+        if self.outstanding(second) / self.weight(second) < self.outstanding(first) / self.weight(first):
+            return second
+        return first
+
+
+class WeightedRoundRobinSelection(Selection):
+    """
+    Smooth weighted round-robin by the capacity of the nodes
+    """
+
+    def __init__(self, routing):
+        super().__init__(routing)
+        self.current = {}
+
+    def select(self, candidates):
+        best = None
+        total = 0
+        for c in candidates:
+            for skill in c:
+                weight = self.weight(skill)
+                self.current[skill['_key']] = self.current.get(skill['_key'], 0) + weight
+                total += weight
+                if best is None or self.current[skill['_key']] > self.current[best['_key']]:
+                    best = skill
+        if best is not None:
+            self.current[best['_key']] -= total
+        return best
+
+    def remove(self, skill):
+        self.current.pop(skill['_key'], None)
+
+
+strategies = {
+    "random": RandomSelection,
+    "least_outstanding": LeastOutstandingSelection,
+    "power_of_two": PowerOfTwoSelection,
+    "weighted_round_robin": WeightedRoundRobinSelection,
+}
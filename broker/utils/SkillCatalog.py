@@ -0,0 +1,146 @@
+import hashlib
+import json
+import threading
+
+
+class SkillCatalog:
+    """
+    In-memory catalog of all connected skills (materialized view of the skills collection)
+
+    The catalog is maintained incrementally when a node registers or disconnects. Skills are listed per name
+    with the client-visible config (without the options of a single node) and per role, so skill lists and
+    configs are served without a database query. The nodes of a skill are kept by the routing table.
+    Every change increases the version. The hash of a config allows clients to check if their cached config
+    is still valid. Skills without roles (or an empty list of roles) are public, the admin role can see all skills.
+
+    @author: Dennis Zyska
+    """
+    PUBLIC = None
+
+    def __init__(self, routing, node_options=None):
+        self.routing = routing
+        self.node_options = node_options if node_options is not None else []
+        self.skills = {}  # skill name -> {name, config, hash}
+        self.views = {}  # role -> set of skill names (PUBLIC for skills without roles)
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def add(self, skill):
+        """
+        Add a registered node of a skill (after it was added to the routing table)
+
+        :param skill: skill document (with _key and config)
+        :return: version of the catalog
+        """
+        name = skill['config']['name']
+        with self.lock:
+            if name not in self.skills:
+                config = self.client_config(skill['config'])
+                self.skills[name] = {"name": name, "config": config, "hash": self.hash(config)}
+                for role in self._roles(config):
+                    self.views.setdefault(role, set()).add(name)
+            self.version += 1
+            return self.version
+
+    def remove(self, skill):
+        """
+        Remove a node of a skill (after it was removed from the routing table)
+
+        :param skill: skill document (with _key and config)
+        :return: version of the catalog
+        """
+        name = skill['config']['name']
+        with self.lock:
+            entry = self.skills.get(name)
+            if entry is not None and self.routing.count(name) == 0:
+                del self.skills[name]
+                for role in self._roles(entry['config']):
+                    self.views[role].discard(name)
+                    if len(self.views[role]) == 0:
+                        del self.views[role]
+            self.version += 1
+            return self.version
+
+    def client_config(self, config):
+        """
+        Config of a skill without the options of a single node (all nodes of a skill share this config)
+        :param config: skill config
+        :return: config
+        """
+        return {k: v for k, v in config.items() if k not in self.node_options}
+
+    @staticmethod
+    def hash(config):
+        """
+        Hash of a skill config
+        :param config: skill config
+        :return: hex digest
+        """
+        return hashlib.sha256(json.dumps(config, sort_keys=True, separators=(',', ':')).encode("utf-8")).hexdigest()
+
+    def get(self, name, role=None, with_config=False):
+        """
+        Get a skill by name
+
+        :param name: skill name
+        :param role: role of the client (None for all skills)
+        :param with_config: include the config of the skill (and its hash)
+        :return: {name, nodes[, config, hash]} or None if the skill is not available for the role
+        """
+        with self.lock:
+            entry = self.skills.get(name)
+            if entry is None or not self.visible(entry, role):
+                return None
+            return self._item(entry, with_config)
+
+    def get_all(self, role=None, with_config=False):
+        """
+        Get all skills available for a role
+
+        :param role: role of the client (None or admin for all skills)
+        :param with_config: include the config of the skills
+        :return: list of {name, nodes[, config]}
+        """
+        return self.snapshot(role, with_config)[1]
+
+    def snapshot(self, role=None, with_config=False):
+        """
+        Get all skills available for a role with the current version of the catalog
+
+        :param role: role of the client (None or admin for all skills)
+        :param with_config: include the config of the skills
+        :return: version, list of {name, nodes[, config]}
+        """
+        with self.lock:
+            if role is None or role == "admin":
+                names = self.skills.keys()
+            else:
+                names = self.views.get(self.PUBLIC, set()) | self.views.get(role, set())
+            return self.version, [self._item(self.skills[name], with_config) for name in names]
+
+    def visible(self, entry, role):
+        """
+        Check if a skill is available for a role
+        :param entry: catalog entry
+        :param role: role of the client (None for all skills)
+        :return: True if available
+        """
+        if role is None or role == "admin":
+            return True
+        roles = self._roles(entry['config'])
+        return self.PUBLIC in roles or role in roles
+
+    def __len__(self):
+        return len(self.skills)
+
+    def _roles(self, config):
+        if 'roles' in config and len(config['roles']) > 0:
+            return config['roles']
+        return [self.PUBLIC]
+
+    def _item(self, entry, with_config):
+        item = {"name": entry['name'], "nodes": self.routing.count(entry['name'])}
+        if with_config:
+            item["config"] = entry['config']
+            item["hash"] = entry['hash']
+        return item
@@ -0,0 +1,96 @@
+import time
+from collections import deque
+
+
+class TaskQueue:
+    """
+    Pending requests per skill that wait for a free node
+
+    @author: Dennis Zyska
+    """
+
+    def __init__(self, max_depth=100, max_wait=30):
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self.queues = {}  # skill name -> deque of entries
+
+    def put(self, name, sid, payload, reserved, **options):
+        """
+        Add a request to the queue of a skill
+        :param name: skill name
+        :param sid: session id of the request client
+        :param payload: request payload
+        :param reserved: reserved job quota
+        :param options: additional options for dispatching the request
+        :return: position in the queue (starting with 1) or None if the queue is full
+        """
+        queue = self.queues.setdefault(name, deque())
+        if 0 < self.max_depth <= len(queue):
+            return None
+        queue.append({
+            "sid": sid,
+            "payload": payload,
+            "reserved": reserved,
+            "options": options,
+            "queued": time.perf_counter(),
+        })
+        return len(queue)
+
+    def peek(self, name):
+        """
+        Get the next request of a skill without removing it
+        :param name: skill name
+        :return: entry or None
+        """
+        queue = self.queues.get(name)
+        if queue:
+            return queue[0]
+
+    def pop(self, name):
+        """
+        Remove the next request of a skill
+        :param name: skill name
+        :return: entry or None
+        """
+        queue = self.queues.get(name)
+        if queue:
+            entry = queue.popleft()
+            if len(queue) == 0:
+                del self.queues[name]
+            return entry
+
+    def expired(self):
+        """
+        Remove all requests waiting longer than max_wait
+        :return: list of expired entries
+        """
+        if self.max_wait <= 0:
+            return []
+        expired = []
+        deadline = time.perf_counter() - self.max_wait
+        for name in list(self.queues):
+            queue = self.queues[name]
+            # entries are ordered by time
+            while queue and queue[0]["queued"] < deadline:
+                expired.append(queue.popleft())
+            if len(queue) == 0:
+                del self.queues[name]
+        return expired
+
+    def remove(self, sid):
+        """
+        Remove all requests of a client
+        :param sid: session id of the request client
+        :return: list of removed entries
+        """
+        removed = []
+        for name in list(self.queues):
+            queue = self.queues[name]
+            removed.extend(e for e in queue if e["sid"] == sid)
+            self.queues[name] = deque(e for e in queue if e["sid"] != sid)
+            if len(self.queues[name]) == 0:
+                del self.queues[name]
+        return removed
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues.values())
@@ -15,19 +15,34 @@ def simple_client(name, url, client_queue: mp.Queue, message_queue: mp.Queue, sk
                   logging_level="INFO"):
     logger = init_logging(name, level=logging.getLevelName(logging_level))
     sio = socketio.Client(logger=logger, engineio_logger=logger)
+    catalog = {"version": 0}
+    configs = {}  # config hash -> skill config
+    hashes = {}  # skill name -> hash of the last config
 
     @sio.on('skillUpdate')
-    def skill_update(data):
-        logger.debug("skillUpdate: {}".format(data))
+    def skill_update(data, version=None):
+        logger.debug("skillUpdate: {} {}".format(data, version))
+        if version is not None:
+            if not version.get('full', False) and version['previous'] > catalog['version']:
+                sio.emit('skillGetAll')
+            catalog['version'] = max(catalog['version'], version['version'])
         if skill_queue:
             skill_queue.put(data)
         if len(data) > 0:
             for skill in data:
                 if skill['name'] == skill_name:
-                    sio.emit('skillGetConfig', {'name': skill['name']})
+                    sio.emit('skillGetConfig', {'name': skill['name'], 'hash': hashes.get(skill['name'])})
+
+    @sio.on('skillConfig')
+    def skill_config(data, config_hash=None):
+        if config_hash is not None:
+            if config_hash['modified']:
+                configs[config_hash['hash']] = data
+            hashes[config_hash['name']] = config_hash['hash']
+            data = configs.get(config_hash['hash'])
+        logger.debug("skillConfig: {}".format(data))
 
     sio.on('connect', lambda: [sio.emit('skillGetAll'), client_queue.put("connected")])
-    sio.on('skillConfig', lambda data: logger.debug("skillConfig: {}".format(data)))
     sio.on('skillResults', lambda data: [logger.debug("Skill results: {}".format(data)), client_queue.put(data)])
 
     # connect to Broker
@@ -53,6 +68,8 @@ def scrub_job(overwrite_config=None):
     logger = init_logging("Scrub Job", level=logging.getLevelName("INFO"))
     logger.info("Connecting to db...")
     config = load_config()
+    # the running broker keeps its clients and tasks
+    config['cleanDbOnStart'] = False
     if overwrite_config:
         config.update(overwrite_config)
 
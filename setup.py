@@ -13,7 +13,8 @@ setup(
         "python-arango",
         "flask-socketio",
         "pycryptodome",
-        "numpy",
+        "msgpack",
+        "redis",
     ],
     python_requires=">=3.10",
 )
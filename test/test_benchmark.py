@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import tracemalloc
+import unittest
+from collections import deque
+from urllib.parse import urlparse
+
+import msgpack
+import numpy as np
+import socketio
+from dotenv import load_dotenv
+from socketio import packet
+
+from broker import init_logging
+from broker.utils.JobQuota import JobQuota
+from broker.utils.Quota import Quota
+
+
+class LegacyQuota:
+    """
+    Previous request quota (deque of timestamps), kept for the quota benchmark
+    """
+
+    def __init__(self, max_len=100, interval=1):
+        self.max_len = max_len
+        self.interval = interval
+        self.queue = deque(maxlen=self.max_len)
+
+    def __call__(self, append=True):
+        if self.exceed():
+            return True
+        if append:
+            self.queue.append(time.perf_counter())
+        return False
+
+    def exceed(self):
+        if len(self.queue) >= self.max_len:
+            if time.perf_counter() - self.queue[0] >= self.interval:
+                self.queue.popleft()
+                return False
+            return True
+
+
+class LegacyJobQuota:
+    """
+    Previous job quota (numpy array of job ids), kept for the quota benchmark
+    """
+
+    def __init__(self, max_len=100):
+        self.queue = np.zeros(max_len, dtype=int)
+
+    def __call__(self, append=None):
+        if not (self.queue == 0).any():
+            return True
+        if append:
+            self.queue[(self.queue == 0).argmax(axis=0)] = int(append)
+        return False
+
+    def remove(self, task_id):
+        self.queue[self.queue == int(task_id)] = 0
+
+    def update(self, reserved_id, task_id):
+        self.queue[(self.queue == reserved_id).argmax(axis=0)] = task_id
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Micro-benchmarks without a running broker
+    @author: Dennis Zyska
+    """
+    _logger = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls._logger = init_logging(name="Benchmark",
+                                   level=logging.getLevelName(os.getenv("TEST_LOGGING_LEVEL", "INFO")))
+        cls.repeat = int(os.getenv("TEST_BENCHMARK_REPEAT", 200))
+
+    @staticmethod
+    def hf_outputs():
+        """
+        Realistic skillResults of the hf_pipeline skill
+        :return: dict of name -> payload
+        """
+        random.seed(0)
+        labels = ["B-PER", "I-PER", "B-ORG", "I-ORG", "B-LOC", "I-LOC", "B-MISC", "I-MISC"]
+        token_classification = [{
+            'entity': random.choice(labels),
+            'score': random.random(),
+            'index': i,
+            'word': "token{}".format(i),
+            'start': i * 7,
+            'end': i * 7 + 6,
+        } for i in range(500)]
+        text_classification = [[{'label': label, 'score': random.random()} for label in labels] for _ in range(50)]
+        summarization = [{'summary_text': " ".join("word{}".format(i) for i in range(300))}]
+
+        return {name: {'id': "request", 'clientId': None, 'data': data} for name, data in [
+            ("token-classification", token_classification),
+            ("text-classification", text_classification),
+            ("summarization", summarization),
+        ]}
+
+    def measure(self, payload, use_msgpack=False):
+        """
+        Encode and decode a skillResults packet (json packet, the payload as msgpack binary attachment)
+        :return: bytes on the wire, encode time and decode time in ms
+        """
+        encoded = None
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            data = {**payload, 'data': msgpack.packb(payload['data'], use_bin_type=True)} if use_msgpack else payload
+            encoded = packet.Packet(packet.EVENT, data=["skillResults", data]).encode()
+        encode_time = (time.perf_counter() - start) / self.repeat * 1000
+
+        parts = encoded if isinstance(encoded, list) else [encoded]
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            decoded = packet.Packet(encoded_packet=parts[0])
+            for attachment in parts[1:]:
+                decoded.add_attachment(attachment)
+            data = decoded.data[1]
+            if use_msgpack:
+                data = {**data, 'data': msgpack.unpackb(data['data'], raw=False)}
+        decode_time = (time.perf_counter() - start) / self.repeat * 1000
+
+        self.assertEqual(data, payload)
+        size = sum(len(p.encode("utf-8")) if isinstance(p, str) else len(p) for p in parts)
+        return size, encode_time, decode_time
+
+    def test_serialization(self):
+        """
+        Compare json and msgpack encoded payloads of socket.io packets
+        :return:
+        """
+        for name, payload in self.hf_outputs().items():
+            for serializer, use_msgpack in [("json", False), ("msgpack", True)]:
+                size, encode_time, decode_time = self.measure(payload, use_msgpack)
+                self._logger.info("{:<22} {:<8} {:>8} bytes  encode {:.3f}ms  decode {:.3f}ms".format(
+                    name, serializer, size, encode_time, decode_time))
+
+
+    def test_quota(self):
+        """
+        Compare the quota classes with the previous implementation (time per operation and memory per client)
+        :return:
+        """
+        operations = self.repeat * 100
+        for name, quota in [("deque", LegacyQuota(max_len=operations)), ("gcra", Quota(max_len=operations))]:
+            start = time.perf_counter()
+            for _ in range(operations):
+                quota(append=True)
+            self._logger.info("request quota {:<6} {:.3f}us per request".format(
+                name, (time.perf_counter() - start) / operations * 1e6))
+
+        for name, quota, reserve in [("numpy", LegacyJobQuota(max_len=50), lambda: np.random.randint(1000000, 2 ** 31 - 1)),
+                                     ("set", JobQuota(max_len=50), JobQuota.reserve_id)]:
+            start = time.perf_counter()
+            for i in range(operations):
+                reserved = reserve()
+                quota(append=reserved)
+                quota.update(reserved, i + 1)
+                quota.remove(i + 1)
+            self._logger.info("job quota {:<6} {:.3f}us per job".format(
+                name, (time.perf_counter() - start) / operations * 1e6))
+
+        clients = 10000
+        for name, create in [("legacy", lambda: (LegacyQuota(100), LegacyQuota(1000), LegacyJobQuota(50))),
+                             ("new", lambda: (Quota(100), Quota(1000), JobQuota(50)))]:
+            tracemalloc.start()
+            quotas = [create() for _ in range(clients)]
+            for requests, results, jobs in quotas:
+                requests()
+                results()
+                jobs(append=1)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            self._logger.info("quotas {:<6} {:.0f} bytes per client".format(name, size / len(quotas)))
+
+
+class TestReconnect(unittest.TestCase):
+    """
+    Simulate a reconnect storm (e.g., after a restart of the broker) against a running broker
+    @author: Dennis Zyska
+    """
+    _logger = None
+
+    @classmethod
+    def setUpClass(cls):
+        if os.getenv("ENV", None) is not None:
+            load_dotenv(dotenv_path=".env.{}".format(os.getenv("ENV", None)))
+        else:
+            load_dotenv(dotenv_path=".env")
+        cls._logger = init_logging(name="Benchmark",
+                                   level=logging.getLevelName(os.getenv("TEST_LOGGING_LEVEL", "INFO")))
+        cls.url = os.getenv("TEST_URL")
+        if cls.url is None:
+            raise unittest.SkipTest("TEST_URL is not set (needs a running broker)")
+        url = urlparse(cls.url)
+        try:
+            socket.create_connection((url.hostname, url.port or 80), timeout=2).close()
+        except OSError:
+            raise unittest.SkipTest("No broker running at {}".format(cls.url))
+        cls.clients = int(os.getenv("TEST_RECONNECT_CLIENTS", 2000))
+        cls.timeout = float(os.getenv("TEST_RECONNECT_TIMEOUT", 300))
+
+    async def reconnect(self, start, stats):
+        """
+        Connect a client (retry if rejected) and wait for the list of skills
+        :param start: start time of the storm
+        :param stats: dict with the times of the clients
+        :return: client
+        """
+        sio = socketio.AsyncClient()
+        ready = asyncio.Event()
+        sio.on('skillUpdate', lambda data, version=None: ready.set())
+        while not sio.connected:
+            if time.perf_counter() - start > self.timeout:
+                self.fail("Could not connect to the broker at {} within {}s".format(self.url, self.timeout))
+            try:
+                await sio.connect(self.url, transports=['websocket'])
+            except socketio.exceptions.ConnectionError:
+                stats['rejected'] += 1
+                await asyncio.sleep(random.uniform(0.5, 1.5))
+        stats['connected'].append(time.perf_counter() - start)
+        await asyncio.wait_for(ready.wait(), timeout=self.timeout)
+        stats['ready'].append(time.perf_counter() - start)
+        return sio
+
+    async def storm(self):
+        stats = {'connected': [], 'ready': [], 'rejected': 0}
+        start = time.perf_counter()
+        clients = await asyncio.gather(*[self.reconnect(start, stats) for _ in range(self.clients)])
+        steady = time.perf_counter() - start
+        await asyncio.gather(*[sio.disconnect() for sio in clients])
+        return steady, stats
+
+    def test_reconnect_storm(self):
+        """
+        Connect many clients at once and measure the time until all clients have their list of skills
+        :return:
+        """
+        steady, stats = asyncio.run(self.storm())
+        ready = sorted(stats['ready'])
+        self._logger.info("{} clients: steady state after {:.2f}s, p50 {:.2f}s, p99 {:.2f}s, {} rejected connects".format(
+            self.clients, steady, ready[len(ready) // 2], ready[int(len(ready) * 0.99)], stats['rejected']))
+        self.assertEqual(len(ready), self.clients)
@@ -129,6 +129,24 @@ class TestBroker(unittest.TestCase):
         self.assertEqual(message['id'], "simple")
         return message['id'] == "simple"
 
+    def test_batch_request(self):
+        """
+        Test if a batch request is working with combined results
+        :return:
+        """
+        self._logger.info("Start test batch request ...")
+        self.client.put({"event": 'skillRequestBatch', "data": {
+            'id': "batch", 'batchResults': True,
+            'requests': [{'id': "batch_{}".format(i), 'name': "test_skill", 'data': i} for i in range(5)]}})
+
+        result = self.client.wait_for_event("skillResultsBatch")
+        if not result:
+            self.fail("No message received.")
+
+        self.assertEqual(result['data']['id'], "batch")
+        self.assertEqual(sorted(r['id'] for r in result['data']['results']),
+                         ["batch_{}".format(i) for i in range(5)])
+
     def test_stats(self):
         """
         Test if stats are returned if config['return_stats'] is set to True
@@ -150,6 +168,48 @@ class TestBroker(unittest.TestCase):
         self.assertTrue("stats" in message)
         self._logger.info("Simple duration time: {:3f}ms".format((time.perf_counter() - message['data']) * 1000))
 
+    def test_result_cache(self):
+        """
+        Test if a repeated request with the cache option is answered from the result cache
+        :return:
+        """
+        self._logger.info("Start test result cache ...")
+        data = time.perf_counter()
+        for request_id in ["cache_1", "cache_2"]:
+            self.client.clear()
+            self.client.put({"event": 'skillRequest', "data": {'id': request_id, 'name': "test_skill",
+                                                               'config': {'return_stats': True, 'cache': True},
+                                                               'data': data}})
+            message = self.client.wait_for_event("skillResults")
+            if not message:
+                self.fail("No message received.")
+
+        message = message['data']
+        self.assertEqual(message['id'], "cache_2")
+        self.assertEqual(message['data'], data)
+        self.assertTrue(message['stats']['cached'])
+
+    def test_compression(self):
+        """
+        Test if large payloads are compressed (the test node does not support compression)
+        :return:
+        """
+        self._logger.info("Start test compression ...")
+        client = Client(os.getenv("TEST_URL"), logger=self._logger, compression=["zlib"])
+        if not client.start():
+            self.fail("Client not ready by time.")
+        time.sleep(0.5)
+
+        data = {'text': "This is a long text. " * 5000}
+        client.put({"event": 'skillRequest', "data": {'id': "compression", 'name': "test_skill", 'data': data}})
+        message = client.wait_for_event("skillResults")
+        client.stop()
+        if not message:
+            self.fail("No message received.")
+
+        self.assertEqual(message['data']['id'], "compression")
+        self.assertEqual(message['data']['data'], data)
+
     def test_config(self):
         """
         Test different keyword arguments for the config parameter
@@ -454,6 +514,22 @@ class TestBroker(unittest.TestCase):
         else:
             return self.fail("Auth failed")
 
+    def test_auth_ed25519(self):
+        """
+        Check authentication with a new Ed25519 key
+        :return:
+        """
+        self._logger.info("Start test auth ed25519 ...")
+
+        client = Client(logger=self._logger, url=os.getenv("TEST_URL"))
+        client.start()
+        auth = client.auth(private_key_path=None, key_type="ed25519")
+        client.stop()
+        if auth:
+            return self.assertEqual(auth['data']['role'], "user")
+        else:
+            return self.fail("Auth failed")
+
     def test_roles(self):
         """
         Check if skills can be selected for specific roles
@@ -685,14 +761,30 @@ class TestBroker(unittest.TestCase):
         result = self.client.wait_for_event("skillConfig")
         self.assertEqual(result['data']['name'], "test_skill")
 
+        # config is cached per hash, an unchanged config is not sent again
+        config = self.client.get_config("test_skill")
+        self.assertEqual(config['name'], "test_skill")
+        self.client.put({"event": 'skillGetConfig', "data": {'name': "test_skill",
+                                                             'hash': self.client.hashes["test_skill"]}})
+        result = self.client.wait_for_event("skillConfig")
+        self.assertIsNone(result['data'])
+        self.assertFalse(result['hash']['modified'])
+        self.assertEqual(self.client.get_config("test_skill"), config)
+
     def test_task_killer(self):
         """
         Test if task killer is working
         :return:
         """
         self._logger.info("Start test task killer ...")
+        self.client.put({"event": 'skillRequest', "data": {'id': "killer", 'name': "test_skill",
+                                                           'config': {'max_runtime': 1},
+                                                           'data': {'sleep': 3}}})
 
-        pass
+        message = self.client.wait_for_event("error", timeout=5)
+        if not message:
+            self.fail("No message received.")
+        self.assertEqual(message['data']['code'], 102)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+import logging
+import os
+import unittest
+
+from dotenv import load_dotenv
+
+from broker import init_logging, load_config
+from broker.db import connect_db
+
+
+class TestDatabase(unittest.TestCase):
+    """
+    Test the database queries
+    @author: Dennis Zyska
+    """
+    _db = None
+    _logger = None
+
+    @classmethod
+    def setUpClass(cls):
+        if os.getenv("ENV", None) is not None:
+            load_dotenv(dotenv_path=".env.{}".format(os.getenv("ENV", None)))
+        else:
+            load_dotenv(dotenv_path=".env")
+
+        cls._logger = init_logging(name="Unittest",
+                                   level=logging.getLevelName(os.getenv("TEST_LOGGING_LEVEL", "INFO")))
+        config = load_config()
+        config["cleanDbOnStart"] = False
+
+        cls._logger.info("Connect to db...")
+        cls._db = connect_db(config, None)
+
+    def test_indexes(self):
+        """
+        Test if the indexes are migrated (obsolete indexes dropped, all indexes created)
+        :return:
+        """
+        for collection in [self._db.tasks, self._db.skills]:
+            names = [index.get('name') for index in collection.collection.indexes()]
+            for name, _ in collection.indexes:
+                self.assertIn(name, names)
+            for name in collection.obsolete_indexes:
+                self.assertNotIn(name, names)
+
+    def test_queries(self):
+        """
+        Test if no query of the tasks and skills collection does a full collection scan
+        :return:
+        """
+        for collection in [self._db.tasks, self._db.skills]:
+            scans = collection.explain()
+            self._logger.info("Explained queries of {}: {}".format(collection.name, scans))
+            self.assertEqual([name for name, scan in scans.items() if scan], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import time
+import unittest
+
+from broker.utils.JobQuota import JobQuota
+from broker.utils.Quota import Quota
+from broker.utils.RedisJobQuota import RedisJobQuota
+from broker.utils.RedisQuota import RedisQuota
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class TestQuota(unittest.TestCase):
+    """
+    Test the quota classes in memory and in redis (fake redis, no server needed)
+    @author: Dennis Zyska
+    """
+
+    def check_quota(self, quota):
+        self.assertEqual([quota() for _ in range(6)], [False] * 5 + [True])
+        self.assertTrue(quota.exceed())
+        time.sleep(0.25)
+        self.assertFalse(quota())
+        self.assertTrue(quota())
+
+    def check_job_quota(self, quota):
+        self.assertFalse(quota("reserved/1"))
+        self.assertFalse(quota.reserve(["reserved/2", "reserved/3"]))
+        self.assertTrue(quota.reserve(["reserved/4"]))
+        self.assertTrue(quota("reserved/4"))
+        quota.update("reserved/1", 10)
+        quota.remove("reserved/2")
+        self.assertEqual(quota.jobs, {"10", "reserved/3"})
+        self.assertFalse(quota.exceed())
+        quota.remove(10)
+        self.assertEqual(len(quota), 1)
+        # simulated tasks have the task id 0, the reservation is dropped
+        quota.update("reserved/3", 0)
+        self.assertEqual(len(quota), 0)
+
+    def test_reserve_id(self):
+        """
+        Reserved ids are unique (also across broker processes)
+        :return:
+        """
+        ids = {JobQuota.reserve_id() for _ in range(1000)}
+        self.assertEqual(len(ids), 1000)
+        self.assertTrue(all(i.startswith("reserved/") and len(i) == 41 for i in ids))
+
+    def test_memory(self):
+        """
+        Test the quota classes in memory
+        :return:
+        """
+        self.check_quota(Quota(max_len=5, interval=1))
+        self.check_job_quota(JobQuota(max_len=3))
+
+    @unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+    def test_redis(self):
+        """
+        Test the redis quota classes, two instances with the same key share the quota (e.g., two broker processes)
+        :return:
+        """
+        redis = fakeredis.FakeRedis()
+        self.check_quota(RedisQuota(redis, "quota:test:requests", max_len=5, interval=1))
+        self.check_job_quota(RedisJobQuota(redis, "quota:test:jobs", max_len=3))
+
+        first = RedisJobQuota(redis, "quota:shared:jobs", max_len=2)
+        second = RedisJobQuota(redis, "quota:shared:jobs", max_len=2)
+        self.assertFalse(first("reserved/5"))
+        self.assertFalse(second("reserved/6"))
+        self.assertTrue(first("reserved/7"))
+        self.assertEqual(second.jobs, {"reserved/5", "reserved/6"})
+
+
+if __name__ == '__main__':
+    unittest.main()
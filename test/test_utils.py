@@ -0,0 +1,541 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+
+from broker.utils import scrub_job
+from broker.utils.Admission import Admission
+from broker.utils.Compression import Compression
+from broker.utils.Deadlines import Deadlines
+from broker.utils.RateLimiter import RateLimiter
+from broker.utils.ResultCache import ResultCache
+from broker.utils.Routing import Routing
+from broker.utils.Selection import strategies
+from broker.utils.SkillCatalog import SkillCatalog
+from broker.utils.TaskQueue import TaskQueue
+from broker.db.utils.BlobStore import BlobStore
+from broker.db.utils.WriteBehind import WriteBehind
+
+
+def skill(key, sid, name="test", **config):
+    """
+    Skill document of a registered node
+    :param key: skill key
+    :param sid: session id of the node
+    :param name: skill name
+    :param config: additional skill config
+    :return: skill document
+    """
+    return {'_key': key, 'sid': sid, 'config': {'name': name, **config}}
+
+
+class TestCompression(unittest.TestCase):
+    """
+    Test the compression of large payloads (no broker needed)
+    @author: Dennis Zyska
+    """
+
+    @staticmethod
+    def envelope(raw, size):
+        return {'compression': "zlib", 'size': size, 'data': base64.b64encode(zlib.compress(raw)).decode("ascii")}
+
+    def test_roundtrip(self):
+        """
+        Large payloads are compressed, small payloads are passed through
+        """
+        compression = Compression("zlib", threshold=100)
+        data = {'text': "x" * 1000}
+        envelope = compression.compress(data)
+        self.assertTrue(Compression.is_compressed(envelope))
+        self.assertEqual(Compression.decompress(envelope, max_size=2000), data)
+        self.assertEqual(compression.compress({'text': "x"}), {'text': "x"})
+        self.assertEqual(Compression.encode(envelope), data)
+        self.assertIs(Compression.encode(envelope, compression), envelope)
+
+    def test_size(self):
+        """
+        Envelopes with a wrong size are rejected without decompressing more than the size
+        """
+        raw = json.dumps("a" * 1000000).encode("utf-8")
+        for size in [0, -1, True, "10", 1000]:
+            with self.assertRaises(ValueError):
+                Compression.decompress(self.envelope(raw, size), max_size=len(raw))
+        with self.assertRaises(ValueError):
+            Compression.decompress(self.envelope(raw, len(raw)), max_size=1000)
+        with self.assertRaises(ValueError):
+            Compression.decompress(self.envelope(raw, len(raw) + 1))
+        self.assertEqual(len(Compression.decompress(self.envelope(raw, len(raw)))), 1000000)
+
+
+class TestScrubJob(unittest.TestCase):
+    """
+    Test that the scrub job does not clean the database of the running broker (no database needed)
+    @author: Dennis Zyska
+    """
+
+    def test_no_clean(self):
+        with mock.patch("broker.utils.load_config", return_value={'cleanDbOnStart': True}), \
+                mock.patch("broker.utils.connect_db") as connect_db:
+            scrub_job()
+        config = connect_db.call_args[0][0]
+        self.assertFalse(config['cleanDbOnStart'])
+        connect_db.return_value.tasks.scrub.assert_called_once_with(run_forever=False)
+
+
+class TestRouting(unittest.TestCase):
+    """
+    Test the in-memory routing table
+    @author: Dennis Zyska
+    """
+
+    def test_roles(self):
+        """
+        Public nodes are available for every role, nodes with roles only for these roles and admin
+        """
+        routing = Routing()
+        routing.add(skill("a", "node_a"))
+        routing.add(skill("b", "node_b", roles=["user"]))
+        self.assertEqual(routing.count("test"), 2)
+        self.assertEqual(routing.get("test", "guest")['_key'], "a")
+        self.assertEqual(len([s for c in routing.candidates("test", "user") for s in c]), 2)
+        self.assertEqual(len([s for c in routing.candidates("test", "admin") for s in c]), 2)
+        self.assertEqual(routing.remove("node_a")[0]['_key'], "a")
+        self.assertIsNone(routing.get("test", "guest"))
+        self.assertEqual(routing.get("test", "user")['_key'], "b")
+        routing.remove("node_b")
+        self.assertEqual(routing.routes, {})
+        self.assertEqual(routing.positions, {})
+
+    def test_slots(self):
+        """
+        Nodes with all slots in use are not selected, released and rekeyed tasks free the slot
+        """
+        routing = Routing()
+        routing.add(skill("a", "node_a", slots=1))
+        routing.acquire("reserved", "node_a")
+        self.assertFalse(routing.available(routing.skill("a")))
+        self.assertIsNone(routing.get("test", "guest"))
+        routing.rekey("reserved", 1)
+        routing.release("reserved")
+        self.assertIsNone(routing.get("test", "guest"))
+        routing.release(1)
+        routing.release(1)
+        self.assertEqual(routing.outstanding, {})
+        self.assertEqual(routing.get("test", "guest")['_key'], "a")
+
+    def test_remove_outstanding(self):
+        """
+        Outstanding tasks of a removed node do not block a node with the same sid
+        """
+        routing = Routing()
+        routing.add(skill("a", "node_a", slots=1))
+        routing.acquire(1, "node_a")
+        routing.remove("node_a")
+        self.assertEqual(routing.credits, 0)
+        routing.release(1)
+        self.assertEqual(routing.outstanding, {})
+
+    def test_queue_limit(self):
+        """
+        Without slots, nodes are busy with maxNodeTasks outstanding tasks if the queue is enabled
+        """
+        routing = Routing({'queue': {'enabled': True, 'maxNodeTasks': 2}})
+        routing.add(skill("a", "node_a"))
+        routing.acquire(1, "node_a")
+        self.assertIsNotNone(routing.get("test", "guest"))
+        routing.acquire(2, "node_a")
+        self.assertIsNone(routing.get("test", "guest"))
+        self.assertTrue(routing.has_nodes("test", "guest"))
+
+
+class TestSelection(unittest.TestCase):
+    """
+    Test the selection strategies
+    @author: Dennis Zyska
+    """
+
+    def test_empty(self):
+        """
+        All strategies return None without candidates
+        """
+        for name, strategy in strategies.items():
+            with self.subTest(strategy=name):
+                self.assertIsNone(strategy(Routing()).select([[], []]))
+
+    def test_single(self):
+        """
+        All strategies return the only candidate
+        """
+        node = skill("a", "node_a")
+        for name, strategy in strategies.items():
+            with self.subTest(strategy=name):
+                self.assertIs(strategy(Routing()).select([[], [node]]), node)
+
+    def test_least_outstanding(self):
+        """
+        The node with the lowest load relative to its capacity is selected
+        """
+        routing = Routing()
+        nodes = [skill("a", "node_a"), skill("b", "node_b", capacity=4)]
+        for i in range(3):
+            routing.acquire(i, "node_b")
+        routing.acquire(3, "node_a")
+        self.assertEqual(strategies["least_outstanding"](routing).select([nodes])['_key'], "b")
+        self.assertEqual(strategies["power_of_two"](routing).select([nodes])['_key'], "b")
+
+    def test_weighted_round_robin(self):
+        """
+        Nodes are selected in proportion to their capacity
+        """
+        selection = strategies["weighted_round_robin"](Routing())
+        nodes = [skill("a", "node_a", capacity=3), skill("b", "node_b")]
+        keys = [selection.select([nodes])['_key'] for _ in range(8)]
+        self.assertEqual(keys.count("a"), 6)
+        self.assertEqual(keys.count("b"), 2)
+        selection.remove(nodes[0])
+        self.assertNotIn("a", selection.current)
+
+
+class TestTaskQueue(unittest.TestCase):
+    """
+    Test the pending requests per skill
+    @author: Dennis Zyska
+    """
+
+    def test_order(self):
+        """
+        Requests are returned in order and the queue depth is limited
+        """
+        queue = TaskQueue(max_depth=2)
+        self.assertEqual(queue.put("test", "c1", {'id': 1}, "r1"), 1)
+        self.assertEqual(queue.put("test", "c2", {'id': 2}, "r2", priority=1), 2)
+        self.assertIsNone(queue.put("test", "c3", {'id': 3}, "r3"))
+        self.assertEqual(queue.put("other", "c3", {'id': 3}, "r3"), 1)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.peek("test")['sid'], "c1")
+        self.assertEqual(queue.pop("test")['sid'], "c1")
+        self.assertEqual(queue.pop("test")['options'], {'priority': 1})
+        self.assertIsNone(queue.pop("test"))
+        self.assertNotIn("test", queue.queues)
+
+    def test_expired(self):
+        """
+        Only requests waiting longer than max_wait expire
+        """
+        queue = TaskQueue(max_wait=30)
+        with mock.patch("time.perf_counter", return_value=100):
+            queue.put("test", "c1", {}, "r1")
+        with mock.patch("time.perf_counter", return_value=120):
+            queue.put("test", "c2", {}, "r2")
+        with mock.patch("time.perf_counter", return_value=140):
+            self.assertEqual([e['sid'] for e in queue.expired()], ["c1"])
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(TaskQueue(max_wait=0).expired(), [])
+
+    def test_remove(self):
+        """
+        All requests of a client are removed
+        """
+        queue = TaskQueue()
+        queue.put("test", "c1", {}, "r1")
+        queue.put("test", "c2", {}, "r2")
+        queue.put("other", "c1", {}, "r3")
+        self.assertEqual(sorted(e['reserved'] for e in queue.remove("c1")), ["r1", "r3"])
+        self.assertEqual(list(queue.queues), ["test"])
+
+
+class TestDeadlines(unittest.TestCase):
+    """
+    Test the deadlines of running tasks
+    @author: Dennis Zyska
+    """
+
+    def test_expired(self):
+        """
+        Expired deadlines are returned once, removed and replaced deadlines are skipped
+        """
+        deadlines = Deadlines()
+        with mock.patch("time.monotonic", return_value=100):
+            deadlines.add(1, 10)
+            deadlines.add(2, 10)
+            deadlines.add(3, 10)
+            deadlines.add(4, 30)
+            deadlines.add(3, 30)
+        deadlines.remove(2)
+        deadlines.remove(2)
+        with mock.patch("time.monotonic", return_value=115):
+            self.assertEqual(deadlines.expired(), ["1"])
+            self.assertEqual(deadlines.expired(), [])
+        with mock.patch("time.monotonic", return_value=130):
+            self.assertEqual(sorted(deadlines.expired()), ["3", "4"])
+        self.assertEqual(len(deadlines), 0)
+
+    def test_compact(self):
+        """
+        The heap is compacted if most deadlines are removed
+        """
+        deadlines = Deadlines()
+        for i in range(200):
+            deadlines.add(i, 60)
+        for i in range(150):
+            deadlines.remove(i)
+        self.assertEqual(len(deadlines), 50)
+        self.assertLessEqual(len(deadlines.heap), 100)
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    Test the cache for results of deterministic skills
+    @author: Dennis Zyska
+    """
+
+    def test_key(self):
+        """
+        Keys are independent of the order of the data, the config is part of the key
+        """
+        self.assertEqual(ResultCache.key("test", {'a': 1, 'b': 2}, {}), ResultCache.key("test", {'b': 2, 'a': 1}, {}))
+        self.assertNotEqual(ResultCache.key("test", {'a': 1}, {'v': 1}), ResultCache.key("test", {'a': 1}, {'v': 2}))
+        self.assertIsNone(ResultCache.key("test", {'a': object()}, {}))
+
+    def test_enabled(self):
+        """
+        The request config overrides the skill config, simulated requests are never cached
+        """
+        self.assertTrue(ResultCache.enabled({'cacheable': True}, {}))
+        self.assertFalse(ResultCache.enabled({'cacheable': True}, {'config': {'cache': False}}))
+        self.assertTrue(ResultCache.enabled({}, {'config': {'cache': True}}))
+        self.assertFalse(ResultCache.enabled({}, {'config': {'cache': True, 'simulate': 1}}))
+
+    def test_eviction(self):
+        """
+        Least recently used entries are evicted, entries expire after the ttl of the skill
+        """
+        cache = ResultCache(max_bytes=20, ttl=10, skills={'nocache': 0})
+        cache.put("a", "test", "x" * 8)
+        cache.put("b", "test", "y" * 8)
+        self.assertEqual(cache.get("a"), "x" * 8)
+        cache.put("c", "test", "z" * 8)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "x" * 8)
+        cache.put("d", "test", "x" * 30)
+        cache.put("e", "nocache", 1)
+        self.assertIsNone(cache.get("d"))
+        self.assertIsNone(cache.get("e"))
+        with mock.patch("time.monotonic", return_value=10 ** 9):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats(), {'entries': 1, 'bytes': 10, 'hits': 2, 'misses': 4})
+
+
+class TestBlobStore(unittest.TestCase):
+    """
+    Test the claim-check store for large payloads
+    @author: Dennis Zyska
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.blobs = BlobStore(self.tmp.name, threshold=100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        """
+        Large payloads are stored and loaded, small payloads are passed through
+        """
+        data = {'text': "x" * 1000}
+        ref = self.blobs.put(data)
+        self.assertTrue(BlobStore.is_ref(ref))
+        self.assertEqual(self.blobs.get(ref), data)
+        self.assertEqual(self.blobs.put({'text': "x"}), {'text': "x"})
+        self.blobs.delete(ref)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, ref['_blob'][:2], ref['_blob'])))
+        with self.assertLogs(self.blobs.logger, level="WARNING"):
+            self.blobs.delete(ref)
+
+    def test_invalid(self):
+        """
+        References from clients and corrupted or invalid blobs are rejected
+        """
+        ref = self.blobs.put({'text': "x" * 1000})
+        with self.assertRaises(ValueError):
+            self.blobs.put(ref)
+        with self.assertRaises(ValueError):
+            self.blobs.get({**ref, 'sha256': "0" * 64})
+        with self.assertRaises(ValueError):
+            self.blobs._file("../" + ref['_blob'][3:])
+        self.assertFalse(BlobStore.is_ref({**ref, '_blob': "../etc/passwd"}))
+
+
+class TestSkillCatalog(unittest.TestCase):
+    """
+    Test the in-memory catalog of connected skills
+    @author: Dennis Zyska
+    """
+
+    def test_catalog(self):
+        """
+        Skills are listed per role with the client config until the last node is removed
+        """
+        routing = Routing()
+        catalog = SkillCatalog(routing, node_options=["slots"])
+        for s in [skill("a", "node_a", slots=2), skill("b", "node_b", slots=1),
+                  skill("c", "node_c", name="private", roles=["user"])]:
+            routing.add(s)
+            catalog.add(s)
+        self.assertEqual(catalog.version, 3)
+        self.assertEqual(catalog.get("test", with_config=True)['config'], {'name': "test"})
+        self.assertEqual(catalog.get("test")['nodes'], 2)
+        self.assertIsNone(catalog.get("private", role="guest"))
+        self.assertEqual(sorted(s['name'] for s in catalog.get_all(role="user")), ["private", "test"])
+        self.assertEqual(len(catalog.get_all(role="guest")), 1)
+        for s in routing.remove("node_a"):
+            catalog.remove(s)
+        self.assertEqual(catalog.get("test")['nodes'], 1)
+        for s in routing.remove("node_b"):
+            catalog.remove(s)
+        self.assertIsNone(catalog.get("test"))
+        self.assertEqual(catalog.snapshot(role="guest"), (5, []))
+
+    def test_hash(self):
+        """
+        The hash does not depend on the order of the config
+        """
+        self.assertEqual(SkillCatalog.hash({'a': 1, 'b': 2}), SkillCatalog.hash({'b': 2, 'a': 1}))
+        self.assertNotEqual(SkillCatalog.hash({'a': 1}), SkillCatalog.hash({'a': 2}))
+
+
+class TestRateLimiter(unittest.TestCase):
+    """
+    Test the token bucket per key
+    @author: Dennis Zyska
+    """
+
+    def test_burst(self):
+        """
+        A burst is allowed per key, tokens are refilled with the rate
+        """
+        limiter = RateLimiter(rate=10, burst=5)
+        with mock.patch("time.monotonic", return_value=100):
+            self.assertEqual([limiter("a") for _ in range(6)], [True] * 5 + [False])
+            self.assertTrue(limiter("b"))
+        with mock.patch("time.monotonic", return_value=100.15):
+            self.assertTrue(limiter("a"))
+            self.assertFalse(limiter("a"))
+            limiter.discard("a")
+            self.assertTrue(limiter("a"))
+        self.assertEqual(limiter.get_stats(), {'allowed': 8, 'shed': 2, 'keys': 2})
+
+    def test_max_keys(self):
+        """
+        Keys with a full bucket are dropped if the table gets too large
+        """
+        limiter = RateLimiter(rate=10, burst=5, max_keys=2)
+        with mock.patch("time.monotonic", return_value=100):
+            limiter("a")
+            limiter("b")
+        with mock.patch("time.monotonic", return_value=200):
+            limiter("c")
+        self.assertEqual(list(limiter.tats), ["c"])
+
+
+class TestAdmission(unittest.TestCase):
+    """
+    Test the admission of new connections
+    @author: Dennis Zyska
+    """
+
+    def test_storm(self):
+        """
+        Connections beyond the burst wait for their slot or are rejected if the queue is full
+        """
+        admission = Admission(rate=10, burst=2, max_queue=1, window=5)
+        with mock.patch("time.monotonic", return_value=100), mock.patch("time.sleep") as sleep:
+            self.assertEqual([admission.acquire() for _ in range(3)], [True] * 3)
+            self.assertFalse(admission.storm())
+            sleep.assert_not_called()
+            self.assertTrue(admission.acquire())
+            self.assertAlmostEqual(sleep.call_args[0][0], 0.1)
+            admission.waiting = 1
+            self.assertFalse(admission.acquire())
+            admission.waiting = 0
+            self.assertTrue(admission.storm())
+        with mock.patch("time.monotonic", return_value=106):
+            self.assertFalse(admission.storm())
+            self.assertEqual(admission.get_stats(),
+                             {'admitted': 4, 'queued': 1, 'rejected': 1, 'waiting': 0, 'storm': False})
+
+
+class FakeCollection:
+    """
+    Collection that records bulk imports (or fails)
+    """
+
+    name = "test"
+
+    def __init__(self):
+        self.imported = []
+        self.fail = False
+
+    def import_bulk(self, docs, on_duplicate=None):
+        if self.fail:
+            raise ConnectionError("database not available")
+        self.imported.append(list(docs))
+        return {'created': len(docs)}
+
+
+class TestWriteBehind(unittest.TestCase):
+    """
+    Test the write-behind buffer (no database needed)
+    @author: Dennis Zyska
+    """
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.buffer = WriteBehind(self.collection, batch_size=2, interval=3600, max_pending=100)
+
+    def test_coalesce(self):
+        """
+        Only the latest state of a document is written, in batches
+        """
+        self.buffer.pending["a"] = {'_key': "a", 'v': 1}
+        self.buffer.pending["a"] = {'_key': "a", 'v': 2}
+        self.buffer.pending["b"] = {'_key': "b", 'v': 1}
+        self.buffer.pending["c"] = {'_key': "c", 'v': 1}
+        self.assertEqual(self.buffer.get("a")['v'], 2)
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual([len(b) for b in self.collection.imported], [2, 1])
+        self.assertEqual(self.collection.imported[0][0]['v'], 2)
+        self.assertIsNone(self.buffer.get("a"))
+        self.assertEqual(self.buffer.writing, {})
+
+    def test_error(self):
+        """
+        Documents are kept if the write fails, newer states are not replaced
+        """
+        self.buffer.pending["a"] = {'_key': "a", 'v': 1}
+        self.collection.fail = True
+        with self.assertLogs(self.buffer.logger, level="ERROR"):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.values(), [{'_key': "a", 'v': 1}])
+        self.collection.fail = False
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.values(), [])
+
+    def test_backpressure(self):
+        """
+        The caller writes synchronously if too many documents are pending
+        """
+        self.buffer.max_pending = 3
+        self.buffer.batch_size = 10
+        for key in ["a", "b", "c"]:
+            self.buffer.put({'_key': key})
+        self.assertEqual(len(self.collection.imported), 1)
+        self.assertEqual(self.buffer.values(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()